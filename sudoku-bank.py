@@ -0,0 +1,88 @@
+#!/usr/bin/python
+import time
+import sys
+import os
+import getopt
+import sudokubank
+
+
+def main(argv):
+    bank_path = None
+    is_pretty_output = False
+    difficulties = [1]
+    fill_count = None
+    is_draw_mode = False
+    num_workers = os.cpu_count() or 1
+    seed = None
+    arg_format = 'sudoku-bank.py -b <bank file> -d <difficulty:1-5[,1-5...]> --fill <puzzles> --workers <processes>' + \
+        ' --seed <seed> --draw --pretty'
+    try:
+        opts, args = getopt.getopt(argv, 'hb:d:', [
+            'bank=', 'difficulty=', 'fill=', 'workers=', 'seed=', 'draw', 'pretty'
+        ])
+        for opt, arg in opts:
+            if opt == '-h':
+                print(arg_format)
+                sys.exit()
+            elif opt in ('-b', '--bank'):
+                bank_path = arg
+            elif opt in ('-d', '--difficulty'):
+                parsed_difficulties = [int(d) for d in str(arg).split(',') if d.isdigit() and 1 <= int(d) <= 5]
+                if parsed_difficulties:
+                    difficulties = parsed_difficulties
+            elif opt == '--fill' and str(arg).isdigit():
+                fill_count = int(arg)
+            elif opt == '--workers' and str(arg).isdigit():
+                num_workers = max(1, int(arg))
+            elif opt == '--seed' and str(arg).isdigit():
+                seed = int(arg)
+            elif opt == '--draw':
+                is_draw_mode = True
+            elif opt == '--pretty':
+                is_pretty_output = True
+    except getopt.GetoptError:
+        print(arg_format)
+        sys.exit()
+
+    if bank_path is None:
+        print('No bank file specified')
+        sys.exit()
+
+    try:
+        # opening checks the file header before anything is generated, only filling creates a new bank file
+        bank = sudokubank.SudokuPuzzleBank(bank_path, fill_count is not None)
+    except ValueError:
+        print('Not a puzzle bank file: %s' % bank_path)
+        sys.exit()
+    except OSError:
+        print('Cannot open bank file: %s' % bank_path)
+        sys.exit()
+
+    try:
+        if fill_count is not None:
+            start_time = time.time()
+            num_added = sudokubank.fillBank(bank_path, difficulties, fill_count, num_workers, seed)
+            elapsed_time = time.time() - start_time
+            sys.stderr.write('Added %d puzzles in %.2f sec\n' % (num_added, elapsed_time))
+            if num_added < fill_count:
+                sys.stderr.write('Gave up on %d puzzles\n' % (fill_count - num_added))
+            bank.refresh()
+
+        if is_draw_mode:
+            drawn_puzzle = bank.drawPuzzle(difficulties[0])
+            if drawn_puzzle is None:
+                print('No puzzles of difficulty %d in bank' % difficulties[0])
+                sys.exit()
+            (hidden_numbers_grid, solved_grid, difficulty) = drawn_puzzle
+            hidden_numbers_grid.displayGrid(is_pretty_output)
+        else:
+            # summary of bank contents
+            for difficulty in range(1, 6):
+                print('Difficulty %d:          %d puzzles' % (difficulty, bank.getCount(difficulty)))
+            print('Total:                 %d puzzles' % bank.getCount())
+    finally:
+        bank.close()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,432 @@
+#!/usr/bin/python
+import os
+import time
+import random
+import sys
+import json
+import getopt
+import platform
+import subprocess
+import tracemalloc
+import sudokupuzzle
+
+
+# fixed corpus of generated single-solution puzzles (difficulties 1-5)
+easy_puzzle_corpus = [
+    '2..7..5...7...1....493.8..772..961....5..3.743.1.....9..2...76.95....4..18..6.3..',
+    '89..4....7.5.93.4....8.......8.1.67.4..2......1.3....594......6.83..5.1.5...6423.',
+    '.7.......6..8...92.54...78..6...3..5..8.27..65......79...316.2..1..4....9...5..4.',
+    '5...239...7....3.......8.....4.762311.....49..9......8..74..6..4.5.9......9.8..2.',
+    '..2.9.......3..1.513........49..2.8.2.16..35.3.84..9....4..18..........2...9..6..',
+    '...57..82.4..1.......3.9.1..6..23........79....8.512.46..1.5.4..7943..28..1...6.9',
+    '.7..695..8.5.....6.....3.2.2.49..6.89.16....2...48.......248...52.3...7..43.7....',
+    '1.....285.7......4..9.6...7......5..5.28.9.1..13..4..669..42....2.7.5...7.......8',
+]
+# fixed corpus of "hardest" single-solution puzzles
+hard_puzzle_corpus = [
+    '8..........36......7..9.2...5...7.......457.....1...3...1....68..85...1..9....4..',
+    '1....7.9..3..2...8..96..5....53..9...1..8...26....4...3......1..4......7..7...3..',
+    '..53.....8......2..7..1.5..4....53...1..7...6..32...8..6.5....9..4....3......97..',
+]
+# fixed corpus of 17-clue single-solution puzzles
+clue17_puzzle_corpus = [
+    '4.....8.5.3..........7......2.....6.....8.4......1.......6.3.7.5..2.....1.4......',
+    '52...6.........7.13...........4..8..6......5...........418.........3..2...87.....',
+    '6.....8.3.4.7.................5.4.7.3..2.....1.6.......2.....5.....8.6......1....',
+    '48.3............71.2.......7.5....6....2..8.............1.76...3.....4......5....',
+    '....14....3....2...7..........9...3.6.1.............8.2.....1.4....5.6.....7.8...',
+    '.......1.4.........2...........5.4.7..8...3....1.9....3..4..2...5.1........8.6...',
+]
+puzzle_corpora = {
+    'easy': easy_puzzle_corpus,
+    'hard': hard_puzzle_corpus,
+    '17clue': clue17_puzzle_corpus,
+}
+
+# stages slower than the baseline by more than this fraction (compared on p50) are flagged
+regression_threshold = 0.1
+
+
+def getSeedStageCalls(num_calls):
+    # re-seed already constructed puzzles so only _seedRandomSolvedGrid is timed
+    puzzles = [sudokupuzzle.SudokuPuzzle(seed=i) for i in range(num_calls)]
+    return [puzzle._seedRandomSolvedGrid for puzzle in puzzles]
+
+
+def getHideStageCalls(num_calls, difficulty):
+    calls = []
+    for i in range(num_calls):
+        puzzle = sudokupuzzle.SudokuPuzzle(seed=i)
+        calls.append(lambda puzzle=puzzle: puzzle.getHiddenNumbersGrid(difficulty))
+    return calls
+
+
+def getSolveStageCalls(num_calls, corpus_name, solver_name):
+    calls = []
+    corpus = puzzle_corpora[corpus_name]
+    solver = sudokupuzzle.SOLVER_CLASSES[solver_name]()
+    for i in range(num_calls):
+        grid = sudokupuzzle.SudokuGrid()
+        grid.seedFromString(corpus[i % len(corpus)])
+        calls.append(lambda grid=grid: solver.checkHasSingleSolution(grid))
+    return calls
+
+
+def getStartupStageCalls(num_calls, subcommand_args):
+    # each call runs the sudoku.py entry point in a fresh interpreter, timing startup plus its first puzzle
+    entry_point_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sudoku.py')
+    command = [sys.executable, entry_point_path] + subcommand_args
+    return [
+        lambda: subprocess.run(command, stdout=subprocess.DEVNULL, check=True) for i in range(num_calls)
+    ]
+
+
+def getStages(solver_names):
+    # (stage name, function returning num_calls fresh zero argument calls to time)
+    stages = [('seed', getSeedStageCalls)]
+    for difficulty in range(1, 6):
+        stages.append((
+            'hide-%d' % difficulty,
+            lambda num_calls, difficulty=difficulty: getHideStageCalls(num_calls, difficulty),
+        ))
+    for solver_name in solver_names:
+        for corpus_name in ('easy', 'hard', '17clue'):
+            stages.append((
+                'solve-%s-%s' % (corpus_name, solver_name),
+                lambda num_calls, corpus_name=corpus_name, solver_name=solver_name:
+                    getSolveStageCalls(num_calls, corpus_name, solver_name),
+            ))
+    # whole process runs, allocation figures only cover the parent side
+    stages.append(('startup-generate', lambda num_calls: getStartupStageCalls(
+        num_calls, ['generate', '-d', '1', '--seed', '1']
+    )))
+    stages.append(('startup-solve', lambda num_calls: getStartupStageCalls(
+        num_calls, ['solve', '-p', easy_puzzle_corpus[0]]
+    )))
+    return stages
+
+
+def verifyUniquenessChecker(num_cases):
+    # hides the orbits of seeded solved grids one at a time in random order, the way the generator does (single
+    #   positions, symmetric pairs and quads, on 9x9 and 4x4 grids), and compares every checker answer and every
+    #   position it forces visible with a full DLX count
+    # returns (checks made, failure descriptions)
+    dlx_solver = sudokupuzzle.SudokuDLXSolver()
+    num_checks = 0
+    failures = []
+    for case_num in range(num_cases):
+        symmetry = (None, 'rotational', 'quad')[case_num % 3]
+        box_size = 2 if case_num % 4 == 3 else 3
+        puzzle = sudokupuzzle.SudokuPuzzle(seed=case_num, box_size=box_size)
+        checker = sudokupuzzle.SudokuUniquenessChecker(puzzle.solved_grid)
+        grid = checker.puzzle_grid
+        if symmetry is None:
+            orbits = [((x, y),) for y in range(grid.shape.size) for x in range(grid.shape.size)]
+        else:
+            orbits = sudokupuzzle.getSymmetryOrbits(grid.shape, symmetry)
+        random.Random(case_num).shuffle(orbits)
+        for orbit in orbits:
+            trail_mark = grid.getTrailMark()
+            for (x, y) in orbit:
+                grid.setXYValue(x, y, None)
+            is_single_solution = checker.checkHiddenXYsKeepSingleSolution(orbit)
+            num_solutions = dlx_solver.countSolutions(grid, 2)
+            num_checks += 1
+            if is_single_solution != (num_solutions == 1):
+                failures.append('seed %d, %s orbit %r: checker says %s, DLX found %d solutions' % (
+                    case_num, symmetry, orbit, is_single_solution, num_solutions
+                ))
+            if num_solutions != 1:
+                # carry on from the right state whatever the checker said
+                grid.undoToTrailMark(trail_mark)
+                continue
+            for (x, y) in checker.getForcedVisibleXYs(orbit):
+                forced_trail_mark = grid.getTrailMark()
+                grid.setXYValue(x, y, None)
+                num_checks += 1
+                if dlx_solver.countSolutions(grid, 2) == 1:
+                    failures.append('seed %d: %d, %d was forced visible but hiding it keeps one solution' % (
+                        case_num, x, y
+                    ))
+                grid.undoToTrailMark(forced_trail_mark)
+    return (num_checks, failures)
+
+
+def verifyMinimalPuzzles(num_cases):
+    # generates minimal puzzles (plain and symmetric) and checks each has a single solution and that hiding any
+    #   visible position (or whole visible orbit) left would break it
+    dlx_solver = sudokupuzzle.SudokuDLXSolver()
+    num_checks = 0
+    failures = []
+    for case_num in range(num_cases):
+        symmetry = (None, 'rotational', 'mirror')[case_num % 3]
+        difficulty = case_num % 5 + 1
+        (puzzle, hidden_numbers_grid) = sudokupuzzle.generatePuzzle(
+            difficulty, seed=case_num, symmetry=symmetry, is_minimal=True
+        )
+        num_checks += 1
+        if hidden_numbers_grid is None:
+            failures.append('seed %d: no minimal puzzle generated (%s)' % (case_num, puzzle.getStatus()))
+            continue
+        if dlx_solver.countSolutions(hidden_numbers_grid, 2) != 1:
+            failures.append('seed %d: minimal puzzle does not have a single solution' % case_num)
+            continue
+        shape = hidden_numbers_grid.shape
+        if symmetry is None:
+            orbits = [((x, y),) for y in range(shape.size) for x in range(shape.size)]
+        else:
+            orbits = sudokupuzzle.getSymmetryOrbits(shape, symmetry)
+        for orbit in orbits:
+            if not all(hidden_numbers_grid.getXYValue(x, y) for (x, y) in orbit):
+                continue
+            grid = hidden_numbers_grid.getCopy()
+            for (x, y) in orbit:
+                grid.setXYValue(x, y, None)
+            num_checks += 1
+            if dlx_solver.countSolutions(grid, 2) == 1:
+                failures.append('seed %d, %s: orbit %r can still be hidden, puzzle is not minimal' % (
+                    case_num, symmetry, orbit
+                ))
+    return (num_checks, failures)
+
+
+def verifyCacheCanonicalKeys(num_cases):
+    # relabeled and transposed copies of a partly hidden solved grid (box sizes 2-5) must share its canonical
+    #   result cache key, map to and from the canonical form losslessly, and get the solution stored for the
+    #   original back in their own values and orientation, plain keys must round trip unchanged
+    import sudokucache
+    num_checks = 0
+    failures = []
+    for case_num in range(num_cases):
+        rng = random.Random(case_num)
+        box_size = sudokupuzzle.GRID_BOX_SIZES[case_num % len(sudokupuzzle.GRID_BOX_SIZES)]
+        shape = sudokupuzzle.getGridShape(box_size)
+        solved_cells = bytes(sudokupuzzle.SudokuPuzzle(seed=case_num, box_size=box_size).solved_grid.cells)
+        puzzle_cells = bytes(value if rng.random() < 0.4 else 0 for value in solved_cells)
+
+        values = list(range(1, shape.size + 1))
+        rng.shuffle(values)
+        relabel_table = bytes([0] + values + list(range(shape.size + 1, 256)))
+        is_transposed = case_num % 2 == 1
+
+        def getVariantCells(cells):
+            cells = cells.translate(relabel_table)
+            if is_transposed:
+                cells = bytes(map(cells.__getitem__, shape.column_order_cells))
+            return cells
+
+        for is_canonical in (True, False):
+            num_checks += 1
+            cache = sudokucache.SudokuResultCache(16, is_canonical, box_size)
+            cache_key = cache._getCacheKey(puzzle_cells)
+            cache.store(cache_key, [solved_cells], 1, 2, sudokupuzzle.SEARCH_DONE)
+            lookup_cells = getVariantCells(puzzle_cells) if is_canonical else puzzle_cells
+            expected_cells = getVariantCells(solved_cells) if is_canonical else solved_cells
+            lookup_key = cache._getCacheKey(lookup_cells)
+            label = 'seed %d, %dx%d, %s key' % (
+                case_num, shape.size, shape.size, 'canonical' if is_canonical else 'plain'
+            )
+            if lookup_key[0] != cache_key[0]:
+                failures.append('%s: relabeled/transposed copy has a different key' % label)
+                continue
+            for cells in (lookup_cells, expected_cells):
+                if cache._fromCanonical(cache._toCanonical(cells, lookup_key), lookup_key) != cells:
+                    failures.append('%s: canonical form does not map back to the grid' % label)
+            (found_key, solutions) = cache.lookup(sudokupuzzle.SudokuGrid(box_size).seedFromCells(lookup_cells), 2)
+            if solutions is None or [bytes(solution) for solution in solutions] != [expected_cells]:
+                failures.append('%s: cached solution does not map back to the asking grid' % label)
+    return (num_checks, failures)
+
+
+def verifyPackedCells(num_cases):
+    # random grids of every box size (all empty and all the biggest value included) must survive packCells /
+    #   unpackCells and a trip through a packed puzzle file written by SudokuRecordWriter unchanged
+    import io
+    import sudokuformat
+    num_checks = 0
+    failures = []
+    for box_size in sudokupuzzle.GRID_BOX_SIZES:
+        shape = sudokupuzzle.getGridShape(box_size)
+        rng = random.Random(box_size)
+        grids = [bytes(shape.num_cells), bytes([shape.size]) * shape.num_cells] + [
+            bytes(rng.randint(0, shape.size) for i in range(shape.num_cells)) for case_num in range(num_cases)
+        ]
+        output_file = io.BytesIO()
+        record_writer = sudokuformat.SudokuRecordWriter(output_file, box_size)
+        records = []
+        for (grid_num, cells) in enumerate(grids):
+            num_checks += 1
+            packed_cells = sudokuformat.packCells(cells, shape)
+            if len(packed_cells) != sudokuformat.getPackedSize(shape):
+                failures.append('%dx%d grid %d: packed to %d bytes' % (
+                    shape.size, shape.size, grid_num, len(packed_cells)
+                ))
+            if sudokuformat.unpackCells(packed_cells, shape) != cells:
+                failures.append('%dx%d grid %d: does not unpack to the same values' % (
+                    shape.size, shape.size, grid_num
+                ))
+            # the next grid doubles as the solution so both grids of a record vary
+            solution_cells = grids[(grid_num + 1) % len(grids)]
+            difficulty = grid_num % 6 if grid_num % 7 else None
+            status = grid_num % len(sudokuformat.RECORD_STATUS_NAMES)
+            record_writer.writePackedRecords(sudokuformat.packRecord(
+                shape, cells, solution_cells, difficulty, status
+            ))
+            records.append((
+                cells, solution_cells if solution_cells.count(0) != len(solution_cells) else None, difficulty,
+                status,
+            ))
+        with sudokuformat.SudokuRecordReader(output_file.getvalue()) as record_reader:
+            num_checks += 1
+            if record_reader.getCount() != len(records):
+                failures.append('%dx%d file: %d records read back of %d' % (
+                    shape.size, shape.size, record_reader.getCount(), len(records)
+                ))
+                continue
+            for (record_num, record) in enumerate(records):
+                if tuple(record_reader.getRecordCells(record_num)) != record:
+                    failures.append('%dx%d file: record %d does not read back the same' % (
+                        shape.size, shape.size, record_num
+                    ))
+    return (num_checks, failures)
+
+
+def getVerifyChecks():
+    # (check name, function(num_cases) returning (checks made, failure descriptions)) run by --verify
+    return [
+        ('verify-checker', verifyUniquenessChecker),
+        ('verify-minimal', verifyMinimalPuzzles),
+        ('verify-cache', verifyCacheCanonicalKeys),
+        ('verify-packed', verifyPackedCells),
+    ]
+
+
+def runVerify(num_cases, stage_filter):
+    # returns True when every check passed, failures are listed under their check
+    is_passed = True
+    print('%-24s %9s  %s' % ('check', 'checks', 'result'))
+    for (check_name, check_function) in getVerifyChecks():
+        if stage_filter is not None and not check_name.startswith(stage_filter):
+            continue
+        (num_checks, failures) = check_function(num_cases)
+        print('%-24s %9d  %s' % (check_name, num_checks, 'FAILED (%d)' % len(failures) if failures else 'ok'))
+        for failure in failures:
+            print('    ' + failure)
+        is_passed = is_passed and not failures
+    return is_passed
+
+
+def runStage(get_calls, num_calls, num_alloc_calls):
+    call_times = []
+    for call in get_calls(num_calls):
+        start_time = time.perf_counter()
+        call()
+        call_times.append(time.perf_counter() - start_time)
+    call_times.sort()
+
+    # separate (slower) pass with allocation tracing, peak bytes allocated during each call
+    call_peaks = []
+    alloc_calls = get_calls(num_alloc_calls)
+    tracemalloc.start()
+    for call in alloc_calls:
+        tracemalloc.reset_peak()
+        (start_size, start_peak) = tracemalloc.get_traced_memory()
+        call()
+        (end_size, end_peak) = tracemalloc.get_traced_memory()
+        call_peaks.append(end_peak - start_size)
+    tracemalloc.stop()
+
+    return {
+        'calls': num_calls,
+        'mean_ms': sum(call_times) / len(call_times) * 1000,
+        'p50_ms': sudokupuzzle.getPercentile(call_times, 50) * 1000,
+        'p90_ms': sudokupuzzle.getPercentile(call_times, 90) * 1000,
+        'p99_ms': sudokupuzzle.getPercentile(call_times, 99) * 1000,
+        'max_ms': call_times[-1] * 1000,
+        'alloc_peak_kb': sum(call_peaks) / len(call_peaks) / 1024.0,
+    }
+
+
+def displayResults(results, baseline_results):
+    print('%-24s %9s %9s %9s %9s %9s %10s' % ('stage', 'mean ms', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms', 'alloc KB'))
+    for (stage_name, stage_result) in results['stages'].items():
+        line = '%-24s %9.3f %9.3f %9.3f %9.3f %9.3f %10.1f' % (
+            stage_name,
+            stage_result['mean_ms'],
+            stage_result['p50_ms'],
+            stage_result['p90_ms'],
+            stage_result['p99_ms'],
+            stage_result['max_ms'],
+            stage_result['alloc_peak_kb'],
+        )
+        if baseline_results is not None and stage_name in baseline_results['stages']:
+            baseline_p50 = baseline_results['stages'][stage_name]['p50_ms']
+            change = (stage_result['p50_ms'] - baseline_p50) / baseline_p50 if baseline_p50 else 0
+            line += '  %+6.1f%%' % (change * 100)
+            if change > regression_threshold:
+                line += '  REGRESSION'
+        print(line)
+
+
+def main(argv):
+    num_calls = 20
+    num_alloc_calls = 5
+    stage_filter = None
+    solver_names = list(sudokupuzzle.SOLVER_CLASSES)
+    json_path = None
+    baseline_path = None
+    is_verify_mode = False
+    arg_format = 'sudoku-benchmark.py -n <calls per stage> -s <stage name prefix> --solver <backtrack|dlx>' + \
+        ' --json <results file> --compare <baseline results file> --verify'
+    try:
+        opts, args = getopt.getopt(argv, 'hn:s:', ['calls=', 'stage=', 'solver=', 'json=', 'compare=', 'verify'])
+        for opt, arg in opts:
+            if opt == '-h':
+                print(arg_format)
+                sys.exit()
+            elif opt in ('-n', '--calls') and str(arg).isdigit():
+                num_calls = max(1, int(arg))
+                num_alloc_calls = max(1, num_calls // 4)
+            elif opt in ('-s', '--stage'):
+                stage_filter = arg
+            elif opt == '--solver' and arg in sudokupuzzle.SOLVER_CLASSES:
+                solver_names = [arg]
+            elif opt == '--json':
+                json_path = arg
+            elif opt == '--compare':
+                baseline_path = arg
+            elif opt == '--verify':
+                # correctness checks instead of timings, -n sets the cases per check
+                is_verify_mode = True
+    except getopt.GetoptError:
+        print(arg_format)
+        sys.exit()
+
+    if is_verify_mode:
+        # a failed check exits non-zero so scripts can gate on it
+        sys.exit(0 if runVerify(num_calls, stage_filter) else 1)
+
+    baseline_results = None
+    if baseline_path is not None:
+        with open(baseline_path, 'r') as baseline_file:
+            baseline_results = json.load(baseline_file)
+
+    results = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'stages': {},
+    }
+    for (stage_name, get_calls) in getStages(solver_names):
+        if stage_filter is not None and not stage_name.startswith(stage_filter):
+            continue
+        results['stages'][stage_name] = runStage(get_calls, num_calls, num_alloc_calls)
+
+    displayResults(results, baseline_results)
+
+    if json_path is not None:
+        with open(json_path, 'w') as json_file:
+            json.dump(results, json_file, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
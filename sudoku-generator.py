@@ -1,5 +1,5 @@
 #!/usr/bin/python
-import math
+import os
 import random
 import time
 import sys
@@ -7,49 +7,292 @@ import getopt
 import sudokupuzzle
 
 
-argv = sys.argv[1:]
-is_debug_mode = False
-is_pretty_output = False
-difficulty = 1
-arg_format = 'sudoku-generator.py -d <difficulty:1-5> --debug --pretty'
-try:
-    opts, args = getopt.getopt(argv, 'hd:', ['difficulty=', 'debug', 'pretty'])
-    for opt, arg in opts:
-        if opt == '-h':
-            print(arg_format)
-            sys.exit()
-        elif opt in ('-d', '--difficulty') and str(arg).isdigit():
-            arg = int(arg)
-            if 0 <= arg <= 5:
-                # difficulty within proper range
-                difficulty = int(arg)
-        elif opt == '--debug':
-            is_debug_mode = True
-        elif opt == '--pretty':
-            is_pretty_output = True
-except getopt.GetoptError:
-    print(arg_format)
-    sys.exit()
-
-
-start_time = time.time()
-puzzle = sudokupuzzle.SudokuPuzzle()
-hidden_numbers_grid = puzzle.getHiddenNumbersGrid(difficulty)
-
-
-if is_debug_mode:
-    solved_grid = puzzle.solved_grid
-    solved_grid.displayGrid()
-    solved_grid.displayGrid(False)
-    print('')
-    hidden_numbers_grid.displayGrid()
-    hidden_numbers_grid.displayGrid(False)
-    print('')
+# solved grid pool for each batch worker process, built on first use
+batch_grid_pool = None
+# percentiles of the per stage generate times in the batch summary
+summary_percentiles = (50, 95, 99)
 
+
+def generateBatchPuzzle(task):
+    # returns (difficulty, output line or packed record when is_packed_output (None if the budget ran out before
+    #   any puzzle), elapsed time, generate status, stage times)
+    (
+        difficulty, solver_name, is_pretty_output, seed, pool_size, pool_seed, score_band, box_size, symmetry,
+        is_minimal, is_packed_output, time_budget, node_budget,
+    ) = task
+    global batch_grid_pool
+    if pool_size and batch_grid_pool is None:
+        # every worker builds the same pool from the batch seed so seeded batches stay reproducible
+        import sudokutransform
+        batch_grid_pool = sudokutransform.SudokuGridPool(pool_size, pool_seed)
+    start_time = time.time()
+    (puzzle, hidden_numbers_grid) = sudokupuzzle.generatePuzzle(
+        difficulty, solver_name, seed, batch_grid_pool, score_band, False, box_size, symmetry, is_minimal,
+        time_budget, node_budget,
+    )
+    if hidden_numbers_grid is None:
+        output = None
+    elif is_packed_output:
+        import sudokuformat
+        output = sudokuformat.packRecord(
+            hidden_numbers_grid.shape, hidden_numbers_grid.cells, puzzle.solved_grid.cells, difficulty,
+            sudokuformat.RECORD_SOLVED,
+        )
+    else:
+        output = hidden_numbers_grid.getDisplayString(is_pretty_output)
+    return (difficulty, output, time.time() - start_time, puzzle.getStatus(), puzzle.getStageTimes())
+
+
+def runBatch(difficulties, count, num_workers, solver_name, is_pretty_output, output_file, seed, pool_size,
+             score_band = None, box_size = 3, symmetry = None, is_minimal = False, is_packed_output = False,
+             time_budget = None, node_budget = None):
+    # with is_packed_output the output file is binary and gets a packed puzzle file (sudokuformat) holding each
+    #   puzzle with its solution and difficulty
+    # every puzzle gets its own seed, drawn in order so a seeded batch produces the same puzzles no matter
+    #   which worker generates each one (unseeded puzzles each get a fresh random stream)
+    seed_random = random.Random(seed) if seed is not None else None
+    tasks = ((
+        difficulties[i % len(difficulties)],
+        solver_name,
+        is_pretty_output,
+        seed_random.getrandbits(64) if seed_random is not None else None,
+        pool_size,
+        seed,
+        score_band,
+        box_size,
+        symmetry,
+        is_minimal,
+        is_packed_output,
+        time_budget,
+        node_budget,
+    ) for i in range(count))
+    difficulty_counts = dict((difficulty, 0) for difficulty in difficulties)
+    difficulty_times = dict((difficulty, 0.0) for difficulty in difficulties)
+    # puzzles by generate status, and every puzzle's seconds per stage ('total' for the whole puzzle)
+    status_counts = {}
+    stage_times = {'total': []}
+
+    record_writer = None
+    if is_packed_output:
+        import sudokuformat
+        record_writer = sudokuformat.SudokuRecordWriter(output_file, box_size)
+
+    start_time = time.time()
+    if num_workers > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(num_workers)
+        results = pool.imap_unordered(generateBatchPuzzle, tasks)
+    else:
+        pool = None
+        results = map(generateBatchPuzzle, tasks)
+
+    try:
+        # stream each puzzle out as soon as it is finished
+        for (difficulty, output, elapsed_time, status, puzzle_stage_times) in results:
+            status_counts[status] = status_counts.get(status, 0) + 1
+            stage_times['total'].append(elapsed_time)
+            for (stage, stage_time) in puzzle_stage_times.items():
+                stage_times.setdefault(stage, []).append(stage_time)
+            if output is None:
+                # out of budget before any puzzle, nothing to write
+                continue
+            if record_writer is not None:
+                record_writer.writePackedRecords(output)
+            else:
+                output_file.write(output + "\n")
+            output_file.flush()
+            difficulty_counts[difficulty] += 1
+            difficulty_times[difficulty] += elapsed_time
+    finally:
+        if pool is not None:
+            pool.terminate()
     elapsed_time = time.time() - start_time
-    print('Overall elapsed time:', round(elapsed_time * 1000, 2))
-    print('Final rand attempts: ', puzzle.seed_random_attempts)
-    print('Final hide attempts: ', puzzle.generate_hidden_numbers_attempts)
-    print('Test result:         ', puzzle.test())
-else:
-    hidden_numbers_grid.displayGrid(is_pretty_output)
+
+    # throughput summary goes to stderr to keep the puzzle output clean
+    for difficulty in difficulties:
+        generate_time = difficulty_times[difficulty]
+        per_worker_rate = difficulty_counts[difficulty] / generate_time if generate_time else 0
+        sys.stderr.write('Difficulty %d:         %d puzzles, %.2f puzzles/sec per worker\n' % (
+            difficulty, difficulty_counts[difficulty], per_worker_rate
+        ))
+    # puzzles given up on or out of budget are requested but never written
+    num_written = sum(difficulty_counts.values())
+    sys.stderr.write('Overall:              %d of %d puzzles in %.2f sec, %.2f puzzles/sec with %d workers\n' % (
+        num_written, count, elapsed_time, num_written / elapsed_time if elapsed_time else 0, num_workers
+    ))
+    # latency breakdown for SLO tracking, stages a puzzle never reached are left out of that stage's times
+    import json
+    stage_percentiles = {}
+    for (stage, times) in stage_times.items():
+        times.sort()
+        stage_percentiles[stage] = dict(
+            ('p%d_ms' % percentile, round(sudokupuzzle.getPercentile(times, percentile) * 1000, 3))
+            for percentile in summary_percentiles
+        )
+        stage_percentiles[stage]['max_ms'] = round(times[-1] * 1000, 3)
+    sys.stderr.write('Generate statuses:    %s\n' % json.dumps(status_counts, sort_keys=True))
+    sys.stderr.write('Stage times:          %s\n' % json.dumps(stage_percentiles, sort_keys=True))
+
+
+def main(argv):
+    is_debug_mode = False
+    is_pretty_output = False
+    solver_name = 'backtrack'
+    difficulty = 1
+    difficulties = [1]
+    count = None
+    num_workers = os.cpu_count() or 1
+    output_path = None
+    seed = None
+    pool_size = 0
+    score_band = None
+    box_size = 3
+    symmetry = None
+    is_minimal = False
+    is_packed_output = False
+    time_budget = None
+    node_budget = None
+    arg_format = 'sudoku-generator.py -d <difficulty:1-5[,1-5...]> --debug --pretty --solver <backtrack|dlx>' + \
+        ' --count <puzzles> --workers <processes> -o <output file> --seed <seed> --pool <base grids>' + \
+        ' --score <min score>-<max score> --box-size <2-5> --symmetry <rotational|mirror|diagonal|quad>' + \
+        ' --minimal --packed --time-budget <ms per puzzle> --node-budget <nodes per puzzle>'
+    try:
+        opts, args = getopt.getopt(argv, 'hd:o:', [
+            'difficulty=', 'debug', 'pretty', 'solver=', 'count=', 'workers=', 'output=', 'seed=', 'pool=',
+            'score=', 'box-size=', 'symmetry=', 'minimal', 'packed', 'time-budget=', 'node-budget=',
+        ])
+        for opt, arg in opts:
+            if opt == '-h':
+                print(arg_format)
+                sys.exit()
+            elif opt in ('-d', '--difficulty'):
+                # batch mode cycles through a comma separated list of difficulties
+                parsed_difficulties = [int(d) for d in str(arg).split(',') if d.isdigit() and 1 <= int(d) <= 5]
+                if parsed_difficulties:
+                    # difficulty within proper range
+                    difficulty = parsed_difficulties[0]
+                    difficulties = parsed_difficulties
+            elif opt == '--debug':
+                is_debug_mode = True
+            elif opt == '--pretty':
+                is_pretty_output = True
+            elif opt == '--solver' and arg in sudokupuzzle.SOLVER_CLASSES:
+                solver_name = arg
+            elif opt == '--count' and str(arg).isdigit():
+                count = int(arg)
+            elif opt == '--workers' and str(arg).isdigit():
+                num_workers = max(1, int(arg))
+            elif opt in ('-o', '--output'):
+                output_path = arg
+            elif opt == '--seed' and str(arg).isdigit():
+                seed = int(arg)
+            elif opt == '--pool' and str(arg).isdigit():
+                # draw solved grids from a pool of this many transformed base grids
+                pool_size = int(arg)
+            elif opt == '--score':
+                # hide numbers until the grader score lands in this band
+                score_limits = str(arg).split('-')
+                if len(score_limits) == 2 and all(limit.isdigit() for limit in score_limits):
+                    score_band = (int(score_limits[0]), int(score_limits[1]))
+                    if score_band[0] > score_band[1]:
+                        print('Score band min must not be more than its max')
+                        sys.exit()
+            elif opt == '--box-size' and str(arg).isdigit() and int(arg) in sudokupuzzle.GRID_BOX_SIZES:
+                # grids of box size squared positions square, 4 for 16x16 puzzles
+                box_size = int(arg)
+            elif opt == '--symmetry' and arg in sudokupuzzle.CLUE_SYMMETRIES:
+                # visible positions keep this symmetry
+                symmetry = arg
+            elif opt == '--minimal':
+                # hide until no more clues can be hidden, the difficulty only sets the hiding order
+                is_minimal = True
+            elif opt == '--packed':
+                # batch mode writes a packed puzzle file (sudokuformat) instead of text lines
+                is_packed_output = True
+            elif opt == '--time-budget' and str(arg).isdigit():
+                # settle for the best puzzle found so far once this many milliseconds are spent on a puzzle
+                time_budget = int(arg) / 1000.0
+            elif opt == '--node-budget' and str(arg).isdigit():
+                # same, once this many seeding values and uniqueness check search nodes are spent on a puzzle
+                node_budget = int(arg)
+    except getopt.GetoptError:
+        print(arg_format)
+        sys.exit()
+
+    if pool_size and box_size != 3:
+        print('Solved grid pools only hold 9x9 grids')
+        sys.exit()
+
+    if score_band is not None and score_band[0] > sudokupuzzle.getMaxGraderScore(box_size):
+        print('Score band out of reach, %dx%d puzzles never score more than %d' % (
+            box_size ** 2, box_size ** 2, sudokupuzzle.getMaxGraderScore(box_size)
+        ))
+        sys.exit()
+
+    if is_packed_output and count is None:
+        print('Packed output is only written in batch mode (--count)')
+        sys.exit()
+
+    if count is not None:
+        if is_packed_output:
+            output_file = open(output_path, 'wb') if output_path else sys.stdout.buffer
+        else:
+            output_file = open(output_path, 'w') if output_path else sys.stdout
+        try:
+            runBatch(
+                difficulties, count, num_workers, solver_name, is_pretty_output, output_file, seed, pool_size,
+                score_band, box_size, symmetry, is_minimal, is_packed_output, time_budget, node_budget,
+            )
+        finally:
+            if output_path:
+                output_file.close()
+        return
+
+    start_time = time.time()
+    grid_pool = None
+    if pool_size:
+        import sudokutransform
+        grid_pool = sudokutransform.SudokuGridPool(pool_size, seed)
+    (puzzle, hidden_numbers_grid) = sudokupuzzle.generatePuzzle(
+        difficulty, solver_name, seed, grid_pool, score_band, is_debug_mode, box_size, symmetry, is_minimal,
+        time_budget, node_budget,
+    )
+
+    if hidden_numbers_grid is None:
+        if puzzle.getStatus() == sudokupuzzle.GENERATE_GAVE_UP:
+            print('Gave up, no puzzle meeting the criteria was found')
+        else:
+            print('Gave up, budget exhausted before any puzzle was found')
+        sys.exit()
+
+    if is_debug_mode:
+        import json
+        solved_grid = puzzle.solved_grid
+        solved_grid.displayGrid()
+        solved_grid.displayGrid(False)
+        print('')
+        hidden_numbers_grid.displayGrid()
+        hidden_numbers_grid.displayGrid(False)
+        print('')
+
+        elapsed_time = time.time() - start_time
+        print('Overall elapsed time:', round(elapsed_time * 1000, 2))
+        print('Final rand attempts: ', puzzle.seed_random_attempts)
+        print('Final hide attempts: ', puzzle.generate_hidden_numbers_attempts)
+        print('Generate status:     ', '%s (%d clues)' % (puzzle.getStatus(), puzzle.getClueCount()))
+        print('Stage times:         ', json.dumps(dict(
+            (stage, round(stage_time * 1000, 2)) for (stage, stage_time) in puzzle.getStageTimes().items()
+        ), sort_keys=True))
+        print('Hide stats:          ', json.dumps(puzzle.getHideStats(), sort_keys=True))
+        print('Test result:         ', puzzle.test())
+        print('Grade:               ', '%d (hardest technique: %s)' % puzzle.getGrade())
+        print('Solver stats:        ', json.dumps(puzzle.getSolverStats(), sort_keys=True))
+    else:
+        hidden_numbers_grid.displayGrid(is_pretty_output)
+        if puzzle.getStatus() != sudokupuzzle.GENERATE_DONE:
+            # the budget ran out first, the puzzle has more clues than asked for
+            sys.stderr.write('Generate status:      %s (%d clues)\n' % (puzzle.getStatus(), puzzle.getClueCount()))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,144 @@
+#!/usr/bin/python
+import sys
+import json
+import time
+import getopt
+import asyncio
+import urllib.parse
+import sudokuserver
+
+
+async def handleHttpRequest(server, reader, writer):
+    # minimal HTTP/1.0: GET /puzzle?difficulty=<1-5> and GET /metrics, one request per connection
+    try:
+        request_line = (await reader.readline()).decode('latin-1').split()
+        while (await reader.readline()).strip():
+            # skip headers
+            pass
+        if len(request_line) < 2 or request_line[0] != 'GET':
+            (status, body) = ('405 Method Not Allowed', {'error': 'only GET is supported'})
+        else:
+            url = urllib.parse.urlparse(request_line[1])
+            query = urllib.parse.parse_qs(url.query)
+            if url.path == '/metrics':
+                (status, body) = ('200 OK', server.getMetrics())
+            elif url.path == '/puzzle':
+                difficulty = query.get('difficulty', ['1'])[0]
+                if not difficulty.isdigit() or int(difficulty) not in server.difficulties:
+                    (status, body) = ('400 Bad Request', {'error': 'unknown difficulty'})
+                else:
+                    try:
+                        (hidden_numbers_grid, solved_grid) = await server.getPuzzle(int(difficulty))
+                        (status, body) = ('200 OK', {
+                            'difficulty': int(difficulty),
+                            'puzzle': hidden_numbers_grid.getDisplayString(False),
+                            'solution': solved_grid.getDisplayString(False),
+                        })
+                    except sudokuserver.SudokuServerBusyError as error:
+                        (status, body) = ('503 Service Unavailable', {'error': str(error)})
+            else:
+                (status, body) = ('404 Not Found', {'error': 'unknown path'})
+
+        body_bytes = json.dumps(body, sort_keys=True).encode('utf-8')
+        writer.write(('HTTP/1.0 %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n' % (
+            status, len(body_bytes)
+        )).encode('latin-1') + body_bytes)
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+async def runBurst(server, difficulties, burst_size, num_bursts):
+    # fires burst_size concurrent requests num_bursts times, once the queues have filled, and reports latency
+    while any(metrics['queue_depth'] < server.watermark for metrics in server.getMetrics().values()):
+        await asyncio.sleep(0.1)
+
+    for burst_num in range(num_bursts):
+        async def timedGetPuzzle(difficulty):
+            start_time = time.perf_counter()
+            try:
+                await server.getPuzzle(difficulty)
+            except sudokuserver.SudokuServerBusyError:
+                return None
+            return time.perf_counter() - start_time
+
+        latencies = await asyncio.gather(*[
+            timedGetPuzzle(difficulties[i % len(difficulties)]) for i in range(burst_size)
+        ])
+        served_latencies = sorted(latency for latency in latencies if latency is not None)
+        if served_latencies:
+            print('Burst %d: %d served, %d rejected, p50 %.3f ms, p90 %.3f ms, max %.3f ms' % (
+                burst_num + 1,
+                len(served_latencies),
+                burst_size - len(served_latencies),
+                served_latencies[len(served_latencies) // 2] * 1000,
+                served_latencies[int((len(served_latencies) - 1) * 0.9)] * 1000,
+                served_latencies[-1] * 1000,
+            ))
+        else:
+            print('Burst %d: all %d rejected' % (burst_num + 1, burst_size))
+        # let the queues refill between bursts
+        await asyncio.sleep(1)
+    print(json.dumps(server.getMetrics(), sort_keys=True, indent=2))
+
+
+async def runServer(difficulties, watermark, num_workers, port, burst_size, num_bursts, seed):
+    async with sudokuserver.SudokuPuzzleServer(difficulties, watermark, num_workers, seed=seed) as server:
+        if burst_size:
+            await runBurst(server, difficulties, burst_size, num_bursts)
+            return
+        http_server = await asyncio.start_server(
+            lambda reader, writer: handleHttpRequest(server, reader, writer), '127.0.0.1', port
+        )
+        print('Serving puzzles on http://127.0.0.1:%d/puzzle?difficulty=1 and /metrics' % port)
+        async with http_server:
+            await http_server.serve_forever()
+
+
+def main(argv):
+    difficulties = [1, 2, 3, 4, 5]
+    watermark = 8
+    num_workers = None
+    port = 8080
+    burst_size = 0
+    num_bursts = 3
+    seed = None
+    arg_format = 'sudoku-server.py -d <difficulty:1-5[,1-5...]> --watermark <ready puzzles per difficulty>' + \
+        ' --workers <processes> --port <port> --burst <concurrent requests> --bursts <count> --seed <seed>'
+    try:
+        opts, args = getopt.getopt(argv, 'hd:', [
+            'difficulty=', 'watermark=', 'workers=', 'port=', 'burst=', 'bursts=', 'seed='
+        ])
+        for opt, arg in opts:
+            if opt == '-h':
+                print(arg_format)
+                sys.exit()
+            elif opt in ('-d', '--difficulty'):
+                parsed_difficulties = [int(d) for d in str(arg).split(',') if d.isdigit() and 1 <= int(d) <= 5]
+                if parsed_difficulties:
+                    difficulties = parsed_difficulties
+            elif opt == '--watermark' and str(arg).isdigit():
+                watermark = max(1, int(arg))
+            elif opt == '--workers' and str(arg).isdigit():
+                num_workers = max(1, int(arg))
+            elif opt == '--port' and str(arg).isdigit():
+                port = int(arg)
+            elif opt == '--burst' and str(arg).isdigit():
+                # no HTTP, serve bursts of local requests and report their latency
+                burst_size = int(arg)
+            elif opt == '--bursts' and str(arg).isdigit():
+                num_bursts = max(1, int(arg))
+            elif opt == '--seed' and str(arg).isdigit():
+                seed = int(arg)
+    except getopt.GetoptError:
+        print(arg_format)
+        sys.exit()
+
+    try:
+        asyncio.run(runServer(difficulties, watermark, num_workers, port, burst_size, num_bursts, seed))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
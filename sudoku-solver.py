@@ -1,77 +1,424 @@
 #!/usr/bin/python
-import math
-import random
 import time
 import sys
 import getopt
+import itertools
+import collections
 import sudokupuzzle
+import sudokuformat
 
 
-argv = sys.argv[1:]
-is_debug_mode = False
-is_pretty_output = False
-puzzle_string = None
-arg_format = 'sudoku-solver.py -p <puzzle> --debug --pretty'
-try:
-    opts, args = getopt.getopt(argv, 'hp:', ['puzzle=', 'debug', 'pretty'])
-    for opt, arg in opts:
-        if opt == '-h':
-            print(arg_format)
-            sys.exit()
-        elif opt in ('-p', '--puzzle'):
-            puzzle_string = str(arg).strip()
-            if len(arg) == 81:
-                # puzzle_string has proper length
-                puzzle_string = arg
-        elif opt == '--debug':
-            is_debug_mode = True
-        elif opt == '--pretty':
-            is_pretty_output = True
-except getopt.GetoptError:
-    print(arg_format)
-    sys.exit()
-
-
-if puzzle_string is None:
-    print('No puzzle string specified')
-    sys.exit()
-
-start_time = time.time()
-input_grid = sudokupuzzle.SudokuGrid()
-is_valid_input_grid = input_grid.seedFromString(puzzle_string)
-
-if not is_valid_input_grid:
-    print('Invalid puzzle string, should be something like this:')
-    print('2..7..5...7...1....493.8..772..961....5..3.743.1.....9..2...76.95....4..18..6.3..')
-    sys.exit()
-
-
-solved_grid = None
-solver = sudokupuzzle.SudokuSolver()
-has_single_solution = solver.checkHasSingleSolution(input_grid)
-if has_single_solution:
+# puzzles handed to a worker at a time in stream mode, and chunks kept in flight per worker
+stream_chunk_size = 256
+stream_chunks_per_worker = 4
+# puzzles per chunk in batch mode, large enough for the array operations to pay off
+batch_chunk_size = 4096
+
+
+def seedInputGrid(line, box_size = 3):
+    # returns (input grid or None when invalid, puzzle string), lines are puzzle strings or the clue values of
+    #   a packed record (bytes), copied onto the grid as they are
+    input_grid = sudokupuzzle.SudokuGrid(box_size)
+    if isinstance(line, str):
+        puzzle_string = line.strip()
+        is_valid_input_grid = input_grid.seedFromString(puzzle_string)
+    else:
+        puzzle_string = sudokuformat.getCellsString(line, input_grid.shape)
+        try:
+            input_grid.seedFromCells(line)
+            is_valid_input_grid = True
+        except ValueError:
+            is_valid_input_grid = False
+    if not is_valid_input_grid or not input_grid.checkIsConsistent():
+        return (None, puzzle_string)
+    return (input_grid, puzzle_string)
+
+
+def solvePuzzleLine(line, solver, box_size = 3):
+    # returns the output line for one input puzzle line: "<status>\t<solution or input puzzle>"
+    (input_grid, puzzle_string) = seedInputGrid(line, box_size)
+    if input_grid is None:
+        return 'invalid\t' + puzzle_string
+
+    solver.checkHasSingleSolution(input_grid)
+    num_solutions = len(solver.found_solutions)
+    if solver.search_status != sudokupuzzle.SEARCH_DONE and num_solutions < 2:
+        # gave up once the node budget ran out
+        return 'budget\t' + puzzle_string
+    elif num_solutions == 0:
+        return 'unsolvable\t' + puzzle_string
+    elif num_solutions > 1:
+        return 'multiple\t' + puzzle_string
+
     solved_grid = solver.getSolutionGrid()
+    if not solved_grid.test():
+        return 'invalid\t' + puzzle_string
+    return 'solved\t' + solved_grid.getDisplayString(False)
+
+
+def solvePuzzleLines(task):
+    (lines, solver_name, node_budget, box_size) = task
+    solver = sudokupuzzle.SOLVER_CLASSES[solver_name](node_budget=node_budget)
+    return [solvePuzzleLine(line, solver, box_size) for line in lines]
+
+
+def solvePuzzleLinesBatch(task):
+    # same output lines as solvePuzzleLines, propagating the whole chunk at once with sudokubatch (needs numpy,
+    #   9x9 puzzles only)
+    (lines, solver_name, node_budget, box_size) = task
+    import sudokubatch
+    if lines and not isinstance(lines[0], str):
+        # clue values of packed records
+        (boards, is_parsed) = sudokubatch.parsePuzzleCells(lines)
+        puzzle_strings = [sudokuformat.getCellsString(line, sudokupuzzle.STANDARD_GRID_SHAPE) for line in lines]
+    else:
+        (boards, is_parsed) = sudokubatch.parsePuzzleStrings(lines)
+        puzzle_strings = [line.strip() for line in lines]
+    (solutions, statuses) = sudokubatch.solveBatch(boards, solver_name, node_budget)
+    output_lines = []
+    for (puzzle_string, is_valid, solution, status) in zip(puzzle_strings, is_parsed, solutions, statuses):
+        if not is_valid:
+            output_lines.append('invalid\t' + puzzle_string)
+        elif status == sudokubatch.BATCH_SOLVED:
+            output_lines.append('solved\t' + ''.join(map(str, solution.tolist())))
+        else:
+            output_lines.append(sudokubatch.BATCH_STATUS_NAMES[status] + '\t' + puzzle_string)
+    return output_lines
+
+
+def splitCachedLines(lines, result_cache, box_size = 3):
+    # answers the lines the result cache already knows about, returns (output lines with None for every line
+    #   still to solve, [(line, cache key)] of the lines still to solve)
+    output_lines = []
+    missed_lines = []
+    for line in lines:
+        (input_grid, puzzle_string) = seedInputGrid(line, box_size)
+        if input_grid is None:
+            # solved as usual to report the invalid line
+            output_lines.append(None)
+            missed_lines.append((line, None))
+            continue
+        (cache_key, cached_solutions) = result_cache.lookup(input_grid, 2)
+        if cached_solutions is None:
+            output_lines.append(None)
+            missed_lines.append((line, cache_key))
+        elif len(cached_solutions) == 1:
+            solved_grid = sudokupuzzle.SudokuGrid(box_size).seedFromValues(cached_solutions[0])
+            output_lines.append('solved\t' + solved_grid.getDisplayString(False))
+        else:
+            output_lines.append(('unsolvable\t' if not cached_solutions else 'multiple\t') + puzzle_string)
+    return (output_lines, missed_lines)
+
+
+def mergeCachedLines(output_lines, missed_lines, solved_lines, result_cache, box_size = 3):
+    # fills the solved lines in after the cached ones and stores their results, only solved and unsolvable
+    #   results are stored (the output of a multiple solution line does not hold its solutions)
+    solved_lines = iter(solved_lines)
+    missed_lines = iter(missed_lines)
+    for (i, output_line) in enumerate(output_lines):
+        if output_line is not None:
+            continue
+        (line, cache_key) = next(missed_lines)
+        output_line = output_lines[i] = next(solved_lines)
+        (status, grid_string) = output_line.split('\t', 1)
+        if cache_key is None:
+            continue
+        elif status == 'solved':
+            solved_grid = sudokupuzzle.SudokuGrid(box_size)
+            solved_grid.seedFromString(grid_string)
+            result_cache.store(cache_key, [solved_grid.cells], 1, 2, sudokupuzzle.SEARCH_DONE)
+        elif status == 'unsolvable':
+            result_cache.store(cache_key, [], 0, 2, sudokupuzzle.SEARCH_DONE)
+    return output_lines
+
+
+def readPuzzleLines(input_file):
+    # yields every line of a text input file, or the clue values of each record of a packed one
+    # blank lines are yielded too (and reported as invalid) so output line N always answers input line N
+    if isinstance(input_file, sudokuformat.SudokuRecordReader):
+        for record_num in range(input_file.getCount()):
+            yield input_file.getRecordCells(record_num)[0]
+        return
+    for line in input_file:
+        yield line
+
+
+def readPuzzleLineChunks(lines, chunk_size = stream_chunk_size):
+    # yields lists of at most chunk_size lines without reading the whole input
+    lines = iter(lines)
+    while True:
+        chunk = list(itertools.islice(lines, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iterSolvedLines(lines, solver_name, num_workers, node_budget, is_batch_mode = False, box_size = 3,
+                    result_cache = None):
+    # lines as yielded by readPuzzleLines, one output line each, with a result cache
+    #   (sudokucache.SudokuResultCache) only the lines it can not answer are handed to the solver, looked up and
+    #   stored here so every worker shares the one cache
+    if is_batch_mode:
+        solve_function = solvePuzzleLinesBatch
+        chunks = readPuzzleLineChunks(lines, batch_chunk_size)
+    else:
+        solve_function = solvePuzzleLines
+        chunks = readPuzzleLineChunks(lines)
+
+    def splitChunk(chunk):
+        # (output lines with None for lines still to solve, lines still to solve with their cache keys, lines
+        #   still to solve)
+        if result_cache is None:
+            return (None, None, chunk)
+        (output_lines, missed_lines) = splitCachedLines(chunk, result_cache, box_size)
+        return (output_lines, missed_lines, [line for (line, cache_key) in missed_lines])
+
+    def mergeChunk(output_lines, missed_lines, solved_lines):
+        if result_cache is None:
+            return solved_lines
+        return mergeCachedLines(output_lines, missed_lines, solved_lines, result_cache, box_size)
+
+    if num_workers <= 1:
+        for chunk in chunks:
+            (output_lines, missed_lines, lines) = splitChunk(chunk)
+            solved_lines = solve_function((lines, solver_name, node_budget, box_size)) if lines else []
+            for output_line in mergeChunk(output_lines, missed_lines, solved_lines):
+                yield output_line
+        return
+
+    # keep a bounded window of chunks in flight, results are collected oldest first to preserve input order
+    import multiprocessing
+    pool = multiprocessing.Pool(num_workers)
+    try:
+        pending = collections.deque()
+        for chunk in chunks:
+            (output_lines, missed_lines, lines) = splitChunk(chunk)
+            pending.append((output_lines, missed_lines, pool.apply_async(
+                solve_function, ((lines, solver_name, node_budget, box_size),)
+            )))
+            if len(pending) >= num_workers * stream_chunks_per_worker:
+                (output_lines, missed_lines, result) = pending.popleft()
+                for output_line in mergeChunk(output_lines, missed_lines, result.get()):
+                    yield output_line
+        while pending:
+            (output_lines, missed_lines, result) = pending.popleft()
+            for output_line in mergeChunk(output_lines, missed_lines, result.get()):
+                yield output_line
+    finally:
+        pool.terminate()
+
+
+def packOutputLine(line, output_line, difficulty, box_size = 3):
+    # packed record for one input line and its output line, invalid input lines keep an empty clue grid
+    (status, grid_string) = output_line.split('\t', 1)
+    shape = sudokupuzzle.getGridShape(box_size)
+    (input_grid, puzzle_string) = seedInputGrid(line, box_size)
+    clue_cells = input_grid.cells if input_grid is not None else bytes(shape.num_cells)
+    solution_cells = None
+    if status == 'solved':
+        solved_grid = sudokupuzzle.SudokuGrid(box_size)
+        solved_grid.seedFromString(grid_string)
+        solution_cells = solved_grid.cells
+    return sudokuformat.packRecord(
+        shape, clue_cells, solution_cells, difficulty,
+        sudokuformat.RECORD_STATUS_NAMES.index(status),
+    )
+
+
+def runStream(input_path, output_path, solver_name, num_workers, node_budget, is_batch_mode = False,
+              box_size = 3, cache_path = None, cache_size = 65536, is_canonical_cache = False,
+              is_packed_output = False):
+    # a cache file is loaded before solving (if it exists) and saved again afterwards, packed puzzle files
+    #   (sudokuformat) are read in place and packed output keeps each input puzzle's difficulty
+    if input_path != '-' and sudokuformat.isRecordFile(input_path):
+        # the file header sets the box size
+        input_file = sudokuformat.SudokuRecordReader(input_path)
+        box_size = input_file.shape.box_size
+        difficulties = input_file.getDifficulties()
+    else:
+        input_file = sys.stdin if input_path == '-' else open(input_path, 'r')
+        difficulties = None
+    result_cache = None
+    if cache_path is not None:
+        import sudokucache
+        result_cache = sudokucache.SudokuResultCache(cache_size, is_canonical_cache, box_size).load(cache_path)
+    if is_packed_output:
+        output_file = open(output_path, 'wb') if output_path else sys.stdout.buffer
+        record_writer = sudokuformat.SudokuRecordWriter(output_file, box_size)
+    else:
+        output_file = open(output_path, 'w') if output_path else sys.stdout
+    try:
+        lines = readPuzzleLines(input_file)
+        if is_packed_output:
+            # the input lines are walked a second time alongside the output to pack each record
+            (lines, record_lines) = itertools.tee(lines)
+        output_lines = iterSolvedLines(
+            lines, solver_name, num_workers, node_budget, is_batch_mode, box_size, result_cache
+        )
+        for (line_num, output_line) in enumerate(output_lines):
+            if is_packed_output:
+                difficulty = difficulties[line_num] if difficulties is not None else sudokuformat.NO_DIFFICULTY
+                record_writer.writePackedRecords(packOutputLine(
+                    next(record_lines), output_line,
+                    None if difficulty == sudokuformat.NO_DIFFICULTY else difficulty, box_size,
+                ))
+            else:
+                output_file.write(output_line + "\n")
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+        if output_path:
+            output_file.close()
+
+    if result_cache is not None:
+        import json
+        result_cache.save(cache_path)
+        # cache summary goes to stderr to keep the solution output clean
+        sys.stderr.write('Result cache:         %s\n' % json.dumps(result_cache.getStats(), sort_keys=True))
+
+
+def main(argv):
+    is_debug_mode = False
+    is_pretty_output = False
+    solver_name = 'backtrack'
+    puzzle_string = None
+    input_path = None
+    output_path = None
+    num_workers = 1
+    node_budget = None
+    is_batch_mode = False
+    box_size = 3
+    cache_path = None
+    cache_size = 65536
+    is_canonical_cache = False
+    is_packed_output = False
+    arg_format = 'sudoku-solver.py -p <puzzle> --debug --pretty --solver <backtrack|dlx>' + \
+        ' -i <puzzle file, - for stdin> -o <output file> --workers <processes> --node-budget <nodes> --batch' + \
+        ' --box-size <2-5> --cache <result cache file> --cache-size <entries> --canonical --packed'
+    try:
+        opts, args = getopt.getopt(argv, 'hp:i:o:', [
+            'puzzle=', 'debug', 'pretty', 'solver=', 'input=', 'output=', 'workers=', 'node-budget=', 'batch',
+            'box-size=', 'cache=', 'cache-size=', 'canonical', 'packed',
+        ])
+        for opt, arg in opts:
+            if opt == '-h':
+                print(arg_format)
+                sys.exit()
+            elif opt in ('-p', '--puzzle'):
+                puzzle_string = str(arg).strip()
+            elif opt == '--debug':
+                is_debug_mode = True
+            elif opt == '--pretty':
+                is_pretty_output = True
+            elif opt == '--solver' and arg in sudokupuzzle.SOLVER_CLASSES:
+                solver_name = arg
+            elif opt in ('-i', '--input'):
+                input_path = arg
+            elif opt in ('-o', '--output'):
+                output_path = arg
+            elif opt == '--workers' and str(arg).isdigit():
+                num_workers = max(1, int(arg))
+            elif opt == '--node-budget' and str(arg).isdigit():
+                node_budget = int(arg)
+            elif opt == '--batch':
+                # stream mode propagates whole chunks of puzzles at once with numpy
+                is_batch_mode = True
+            elif opt == '--box-size' and str(arg).isdigit() and int(arg) in sudokupuzzle.GRID_BOX_SIZES:
+                # puzzles of box size squared positions square, 4 for 16x16 puzzles
+                box_size = int(arg)
+            elif opt == '--cache':
+                # stream mode skips puzzles already solved in this or an earlier run
+                cache_path = arg
+            elif opt == '--cache-size' and str(arg).isdigit():
+                cache_size = max(1, int(arg))
+            elif opt == '--canonical':
+                # cache keys also match relabeled and transposed copies of a puzzle
+                is_canonical_cache = True
+            elif opt == '--packed':
+                # stream mode writes a packed puzzle file (sudokuformat) instead of text lines, packed input
+                #   files are recognized on their own
+                is_packed_output = True
+    except getopt.GetoptError:
+        print(arg_format)
+        sys.exit()
+
+    if input_path is not None:
+        # stream mode, one puzzle per input line and one status + solution per output line
+        if input_path != '-':
+            try:
+                is_record_file = sudokuformat.isRecordFile(input_path)
+            except OSError:
+                print('Cannot read input file: %s' % input_path)
+                sys.exit()
+        if input_path != '-' and is_record_file:
+            # packed puzzle files set the box size in their header
+            try:
+                with sudokuformat.SudokuRecordReader(input_path) as record_reader:
+                    box_size = record_reader.shape.box_size
+            except ValueError:
+                print('Invalid packed puzzle file')
+                sys.exit()
+        if is_batch_mode and box_size != 3:
+            print('Batch mode only solves 9x9 puzzles')
+            sys.exit()
+        if is_batch_mode:
+            import importlib.util
+            if importlib.util.find_spec('numpy') is None:
+                print('Batch mode needs numpy installed')
+                sys.exit()
+        runStream(
+            input_path, output_path, solver_name, num_workers, node_budget, is_batch_mode, box_size, cache_path,
+            cache_size, is_canonical_cache, is_packed_output,
+        )
+        return
+
+    if puzzle_string is None:
+        print('No puzzle string specified')
+        sys.exit()
+
+    start_time = time.time()
+    input_grid = sudokupuzzle.SudokuGrid(box_size)
+    is_valid_input_grid = input_grid.seedFromString(puzzle_string)
+
+    if not is_valid_input_grid:
+        print('Invalid puzzle string, should be something like this:')
+        print('2..7..5...7...1....493.8..772..961....5..3.743.1.....9..2...76.95....4..18..6.3..')
+        sys.exit()
+
+    solved_grid = None
+    solver = sudokupuzzle.SOLVER_CLASSES[solver_name](is_debug_mode, node_budget)
+    has_single_solution = solver.checkHasSingleSolution(input_grid)
+    if has_single_solution:
+        solved_grid = solver.getSolutionGrid()
+
+    if solved_grid is None and solver.search_status != sudokupuzzle.SEARCH_DONE:
+        print('Gave up, node budget exhausted')
+        sys.exit()
+    elif solved_grid is None:
+        print('Bad puzzle string, has more than one solution')
+        sys.exit()
+    elif not solved_grid.test():
+        print('Invalid grid format')
+        sys.exit()
+
+    if is_debug_mode:
+        import json
+        if is_valid_input_grid:
+            input_grid.displayGrid()
+            input_grid.displayGrid(False)
+            print('')
+        if solved_grid != None:
+            solved_grid.displayGrid()
+            solved_grid.displayGrid(False)
+            print('')
+
+        elapsed_time = time.time() - start_time
+        print('Overall elapsed time:', round(elapsed_time * 1000, 2))
+        print('Test result:         ', solved_grid.test())
+        print('Solver stats:        ', json.dumps(solver.getStats().toDict(), sort_keys=True))
+    else:
+        solved_grid.displayGrid(is_pretty_output)
+
 
-if solved_grid is None:
-    print('Bad puzzle string, has more than one solution')
-    sys.exit()
-elif not solved_grid.test():
-    print('Invalid grid format')
-    sys.exit()
-
-
-if is_debug_mode:
-    if is_valid_input_grid:
-        input_grid.displayGrid()
-        input_grid.displayGrid(False)
-        print('')
-    if solved_grid != None:
-        solved_grid.displayGrid()
-        solved_grid.displayGrid(False)
-        print('')
-
-    elapsed_time = time.time() - start_time
-    print('Overall elapsed time:', round(elapsed_time * 1000, 2))
-    print('Test result:         ', solved_grid.test())
-else:
-    solved_grid.displayGrid(is_pretty_output)
+if __name__ == '__main__':
+    main(sys.argv[1:])
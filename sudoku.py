@@ -0,0 +1,27 @@
+#!/usr/bin/python
+import sys
+import importlib
+
+
+# subcommand -> script module run for it, only the chosen one is imported so each subcommand starts up no
+#   slower than running its script directly
+SUBCOMMAND_SCRIPTS = {
+    'generate': 'sudoku-generator',
+    'solve': 'sudoku-solver',
+    'bank': 'sudoku-bank',
+    'serve': 'sudoku-server',
+    'benchmark': 'sudoku-benchmark',
+}
+
+
+def main(argv):
+    arg_format = 'sudoku.py <%s> [subcommand options, -h for help]' % '|'.join(SUBCOMMAND_SCRIPTS)
+    if not argv or argv[0] not in SUBCOMMAND_SCRIPTS:
+        print(arg_format)
+        sys.exit()
+    script = importlib.import_module(SUBCOMMAND_SCRIPTS[argv[0]])
+    script.main(argv[1:])
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,165 @@
+#!/usr/bin/python
+import os
+import mmap
+import array
+import random
+import struct
+import multiprocessing
+import sudokupuzzle
+import sudokuformat
+
+
+# file header: magic, format version, record size
+BANK_MAGIC = b'SUDOKUBK'
+BANK_VERSION = 2
+BANK_HEADER = struct.Struct('<8sHH12x')
+# records are 9x9 sudokuformat records: clue grid, solved grid, difficulty, status, clue count
+BANK_RECORD = sudokuformat.getRecordStruct(sudokupuzzle.STANDARD_GRID_SHAPE)
+RECORD_DIFFICULTY_OFFSET = sudokuformat.getPackedSize(sudokupuzzle.STANDARD_GRID_SHAPE) * 2
+# difficulties the index has room for
+BANK_DIFFICULTIES = range(6)
+
+
+class SudokuPuzzleBank:
+    # append-only file of fixed size puzzle records, memory mapped for reading with an in-memory index of
+    #   record numbers per difficulty so a random puzzle of any difficulty is one record read away
+    # with create=False a missing bank file raises FileNotFoundError instead of being created empty
+    def __init__(self, bank_path, create = True):
+        self.bank_path = bank_path
+        if create and (not os.path.exists(bank_path) or os.path.getsize(bank_path) == 0):
+            with open(bank_path, 'wb') as bank_file:
+                bank_file.write(BANK_HEADER.pack(BANK_MAGIC, BANK_VERSION, BANK_RECORD.size))
+
+        self.bank_file = open(bank_path, 'rb')
+        header = self.bank_file.read(BANK_HEADER.size)
+        if len(header) < BANK_HEADER.size:
+            self.bank_file.close()
+            raise ValueError('Not a puzzle bank file: %s' % bank_path)
+        (magic, version, record_size) = BANK_HEADER.unpack(header)
+        if magic != BANK_MAGIC or version != BANK_VERSION or record_size != BANK_RECORD.size:
+            self.bank_file.close()
+            raise ValueError('Not a puzzle bank file: %s' % bank_path)
+
+        self.bank_map = None
+        self.record_count = 0
+        # record numbers for each difficulty 0-5
+        self.difficulty_index = [array.array('I') for difficulty in BANK_DIFFICULTIES]
+        try:
+            self.refresh()
+        except ValueError:
+            self.close()
+            raise
+
+    def refresh(self):
+        # pick up records appended since the last refresh (by this or any other process), a partially written
+        #   record at the end of the file is left for a later refresh
+        record_count = (os.path.getsize(self.bank_path) - BANK_HEADER.size) // BANK_RECORD.size
+        if record_count == self.record_count:
+            return self
+        if self.bank_map is not None:
+            self.bank_map.close()
+        self.bank_map = mmap.mmap(self.bank_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # difficulty byte of every new record in one strided slice
+        first_offset = BANK_HEADER.size + self.record_count * BANK_RECORD.size + RECORD_DIFFICULTY_OFFSET
+        last_offset = BANK_HEADER.size + record_count * BANK_RECORD.size
+        new_difficulties = self.bank_map[first_offset:last_offset:BANK_RECORD.size]
+        if new_difficulties and max(new_difficulties) not in BANK_DIFFICULTIES:
+            # checked before indexing any of them, so the index never holds part of a refresh
+            raise ValueError('Bad difficulty %d in puzzle bank: %s' % (max(new_difficulties), self.bank_path))
+        for (i, difficulty) in enumerate(new_difficulties):
+            self.difficulty_index[difficulty].append(self.record_count + i)
+        self.record_count = record_count
+        return self
+
+    def getCount(self, difficulty = None):
+        if difficulty is None:
+            return self.record_count
+        return len(self.difficulty_index[difficulty])
+
+    def getRecord(self, record_num):
+        # returns (hidden numbers grid, solved grid, difficulty)
+        offset = BANK_HEADER.size + record_num * BANK_RECORD.size
+        (hidden_cells, solved_cells, difficulty, status) = sudokuformat.unpackRecord(
+            sudokupuzzle.STANDARD_GRID_SHAPE, self.bank_map, offset
+        )
+        hidden_numbers_grid = sudokupuzzle.SudokuGrid().seedFromCells(hidden_cells)
+        solved_grid = sudokupuzzle.SudokuGrid().seedFromCells(solved_cells)
+        return (hidden_numbers_grid, solved_grid, difficulty)
+
+    def drawPuzzle(self, difficulty, rng = None):
+        # random puzzle of the difficulty, None when the bank has none
+        records = self.difficulty_index[difficulty]
+        if not records:
+            return None
+        return self.getRecord(records[(rng or random).randrange(len(records))])
+
+    def appendPuzzles(self, puzzle_records):
+        # puzzle_records are (hidden numbers grid, solved grid, difficulty), records are only ever appended
+        # every record is packed (and its difficulty checked) before any of them is written
+        packed_records = [
+            packBankRecord(hidden_numbers_grid, solved_grid, difficulty)
+            for (hidden_numbers_grid, solved_grid, difficulty) in puzzle_records
+        ]
+        with open(self.bank_path, 'ab') as bank_file:
+            for packed_record in packed_records:
+                bank_file.write(packed_record)
+        return self.refresh()
+
+    def close(self):
+        if self.bank_map is not None:
+            self.bank_map.close()
+            self.bank_map = None
+        self.bank_file.close()
+
+
+def packBankRecord(hidden_numbers_grid, solved_grid, difficulty):
+    if difficulty not in BANK_DIFFICULTIES:
+        raise ValueError('Bad puzzle bank difficulty: %r' % (difficulty,))
+    return sudokuformat.packRecord(
+        sudokupuzzle.STANDARD_GRID_SHAPE, hidden_numbers_grid.cells, solved_grid.cells, difficulty,
+        sudokuformat.RECORD_SOLVED,
+    )
+
+
+def generateBankRecord(task):
+    # packed record, None if every solved grid tried was given up on
+    (difficulty, seed) = task
+    (puzzle, hidden_numbers_grid) = sudokupuzzle.generatePuzzle(difficulty, seed=seed)
+    if hidden_numbers_grid is None:
+        return None
+    return packBankRecord(hidden_numbers_grid, puzzle.getSolvedGrid(), difficulty)
+
+
+def fillBank(bank_path, difficulties, count, num_workers = 1, seed = None):
+    # generate count puzzles (cycling through difficulties) and append them to the bank as they finish, returns
+    #   the number appended (puzzles given up on are left out)
+    # meant to run as a background refill process alongside readers, who call refresh() to see new records
+    # opening creates the bank file if needed and checks it is a bank file before generating anything
+    if not all(1 <= difficulty <= 5 for difficulty in difficulties):
+        raise ValueError('Puzzles are only generated for difficulties 1-5: %r' % (difficulties,))
+    SudokuPuzzleBank(bank_path).close()
+    seed_random = random.Random(seed)
+    tasks = ((difficulties[i % len(difficulties)], seed_random.getrandbits(64)) for i in range(count))
+
+    if num_workers > 1:
+        pool = multiprocessing.Pool(num_workers)
+        records = pool.imap_unordered(generateBankRecord, tasks)
+    else:
+        pool = None
+        records = map(generateBankRecord, tasks)
+
+    num_appended = 0
+    try:
+        with open(bank_path, 'ab') as bank_file:
+            for record in records:
+                if record is None:
+                    continue
+                # one whole record per write so readers never index a partial record
+                bank_file.write(record)
+                bank_file.flush()
+                num_appended += 1
+    finally:
+        if pool is not None:
+            pool.terminate()
+    return num_appended
@@ -0,0 +1,159 @@
+#!/usr/bin/python
+import numpy
+import sudokupuzzle
+
+
+# per board status codes returned by solveBatch, named the same as the sudoku-solver.py stream statuses
+BATCH_SOLVED = 0
+BATCH_UNSOLVABLE = 1
+BATCH_MULTIPLE = 2
+BATCH_INVALID = 3
+BATCH_BUDGET = 4
+BATCH_STATUS_NAMES = ['solved', 'unsolvable', 'multiple', 'invalid', 'budget']
+
+# cell index lookups as arrays for fancy indexing
+CELL_ROW = numpy.array(sudokupuzzle.CELL_ROW)
+CELL_COL = numpy.array(sudokupuzzle.CELL_COL)
+CELL_SUBGRID = numpy.array(sudokupuzzle.CELL_SUBGRID)
+UNIT_CELLS = numpy.array(sudokupuzzle.UNIT_CELLS)
+# lookup of value bit -> value (0 for masks with other than exactly one bit set)
+MASK_SINGLE_VALUES = numpy.array(
+    [values[0] if len(values) == 1 else 0 for values in sudokupuzzle.MASK_VALUES], dtype=numpy.uint8
+)
+MASK_BIT_COUNTS = numpy.array(sudokupuzzle.MASK_BIT_COUNTS, dtype=numpy.uint8)
+# lookup of value -> value bit (0 for empty positions)
+VALUE_BITS = numpy.array([0] + [1 << value for value in range(1, 10)], dtype=numpy.uint16)
+# lookup of puzzle string character code -> value, 0 for '.'
+CHAR_VALUES = numpy.zeros(256, dtype=numpy.uint8)
+CHAR_VALUES[ord('1'):ord('9') + 1] = numpy.arange(1, 10)
+
+
+def parsePuzzleStrings(puzzle_strings):
+    # returns ((N, 81) uint8 boards, (N,) bool array of which strings were valid puzzle strings), sanitized the
+    #   same way as SudokuGrid.seedFromString, invalid strings are left as empty boards
+    puzzle_strings = [sudokupuzzle.cleanPuzzleString(puzzle_string) for puzzle_string in puzzle_strings]
+    is_parsed = numpy.array([len(puzzle_string) == 81 for puzzle_string in puzzle_strings], dtype=bool)
+    boards = numpy.zeros((len(puzzle_strings), 81), dtype=numpy.uint8)
+    if is_parsed.any():
+        parsed_chars = ''.join(
+            puzzle_string for (puzzle_string, is_valid) in zip(puzzle_strings, is_parsed) if is_valid
+        )
+        boards[is_parsed] = CHAR_VALUES[numpy.frombuffer(parsed_chars.encode('ascii'), dtype=numpy.uint8)].reshape(
+            -1, 81
+        )
+    return (boards, is_parsed)
+
+
+def parsePuzzleCells(puzzle_cells):
+    # same as parsePuzzleStrings for clue values listed row by row as bytes (e.g. from packed records), copied
+    #   into the boards in one step, boards with values over 9 are left empty
+    is_parsed = numpy.array([len(cells) == 81 for cells in puzzle_cells], dtype=bool)
+    boards = numpy.zeros((len(puzzle_cells), 81), dtype=numpy.uint8)
+    if is_parsed.any():
+        boards[is_parsed] = numpy.frombuffer(
+            b''.join(cells for (cells, is_valid) in zip(puzzle_cells, is_parsed) if is_valid), dtype=numpy.uint8
+        ).reshape(-1, 81)
+        is_parsed &= boards.max(axis=1) <= 9
+        boards[~is_parsed] = 0
+    return (boards, is_parsed)
+
+
+def _getUnitMasks(boards):
+    # used value masks of each row, col, and subgrid, (N, 9) each
+    bits = VALUE_BITS[boards]
+    row_masks = numpy.bitwise_or.reduce(bits.reshape(-1, 9, 9), axis=2)
+    col_masks = numpy.bitwise_or.reduce(bits.reshape(-1, 9, 9), axis=1)
+    subgrid_masks = numpy.bitwise_or.reduce(
+        bits.reshape(-1, 3, 3, 3, 3).transpose(0, 1, 3, 2, 4).reshape(-1, 9, 9), axis=2
+    )
+    return (row_masks, col_masks, subgrid_masks)
+
+
+def _getConsistentBoards(boards):
+    # (N,) bool, False where a value is repeated within a row, col, or subgrid
+    num_filled = numpy.count_nonzero(boards, axis=1)
+    is_consistent = numpy.ones(len(boards), dtype=bool)
+    for masks in _getUnitMasks(boards):
+        is_consistent &= MASK_BIT_COUNTS[masks].sum(axis=1, dtype=numpy.int64) == num_filled
+    return is_consistent
+
+
+def _getCandidateMasks(boards):
+    # (N, 81) candidate value masks, 0 for filled positions
+    (row_masks, col_masks, subgrid_masks) = _getUnitMasks(boards)
+    used_masks = row_masks[:, CELL_ROW] | col_masks[:, CELL_COL] | subgrid_masks[:, CELL_SUBGRID]
+    candidate_masks = sudokupuzzle.ALL_VALUES_MASK & ~used_masks
+    candidate_masks[boards != 0] = 0
+    return candidate_masks
+
+
+def propagateBoards(boards):
+    # fills naked and hidden singles on every board at once until none of them change, in place
+    # returns (N,) bool, False for boards found to have no solution (a repeated value, or an empty position or
+    #   unit value left with no candidates)
+    is_alive = _getConsistentBoards(boards)
+    active = numpy.flatnonzero(is_alive & (boards == 0).any(axis=1))
+    while len(active):
+        active_boards = boards[active]
+        is_empty = active_boards == 0
+        candidate_masks = _getCandidateMasks(active_boards)
+        is_dead = (is_empty & (candidate_masks == 0)).any(axis=1)
+
+        # naked singles
+        new_boards = numpy.where(is_empty, MASK_SINGLE_VALUES[candidate_masks], active_boards)
+
+        # hidden singles, a value with exactly one candidate position in a unit that does not hold it yet
+        unit_candidate_masks = candidate_masks[:, UNIT_CELLS]
+        unit_used_masks = numpy.bitwise_or.reduce(VALUE_BITS[active_boards][:, UNIT_CELLS], axis=2)
+        for value in range(1, 10):
+            has_value = (unit_candidate_masks >> value) & 1
+            value_positions = has_value.sum(axis=2)
+            is_unit_placed = (unit_used_masks >> value) & 1
+            is_dead |= ((value_positions == 0) & (is_unit_placed == 0)).any(axis=1)
+            (board_nums, unit_nums) = numpy.nonzero(value_positions == 1)
+            if len(board_nums):
+                cell_nums = UNIT_CELLS[unit_nums, has_value[board_nums, unit_nums].argmax(axis=1)]
+                new_boards[board_nums, cell_nums] = value
+
+        # placements that clash with each other show up as repeated values
+        is_dead |= ~_getConsistentBoards(new_boards)
+        is_changed = (new_boards != active_boards).any(axis=1)
+        boards[active] = new_boards
+        is_alive[active[is_dead]] = False
+        active = active[~is_dead & is_changed & (new_boards == 0).any(axis=1)]
+    return is_alive
+
+
+def solveBatch(boards, solver_name = 'backtrack', node_budget = None):
+    # solves an (N, 81) array of boards (values listed row by row, 0 for empty positions)
+    # returns ((N, 81) uint8 solutions, (N,) uint8 BATCH_* status codes), solutions are only filled in for
+    #   BATCH_SOLVED boards
+    # singles are propagated for every board at once, boards left with empty positions fall back to the
+    #   solver_name scalar search
+    boards = numpy.array(boards, dtype=numpy.uint8).reshape(-1, 81)
+    statuses = numpy.full(len(boards), BATCH_UNSOLVABLE, dtype=numpy.uint8)
+    is_valid = (boards <= 9).all(axis=1)
+    statuses[~is_valid] = BATCH_INVALID
+    is_valid[is_valid] = _getConsistentBoards(boards[is_valid])
+    statuses[(statuses != BATCH_INVALID) & ~is_valid] = BATCH_INVALID
+
+    solutions = numpy.where(is_valid[:, numpy.newaxis], boards, 0).astype(numpy.uint8)
+    is_alive = propagateBoards(solutions) & is_valid
+    # singles only ever place forced values, so a board they fill has exactly one solution
+    statuses[is_alive & (solutions != 0).all(axis=1)] = BATCH_SOLVED
+
+    solver = sudokupuzzle.SOLVER_CLASSES[solver_name](node_budget=node_budget)
+    for board_num in numpy.flatnonzero(is_alive & (solutions == 0).any(axis=1)):
+        grid = sudokupuzzle.SudokuGrid().seedFromValues(solutions[board_num].tolist())
+        solver.checkHasSingleSolution(grid)
+        num_solutions = len(solver.found_solutions)
+        if solver.search_status != sudokupuzzle.SEARCH_DONE and num_solutions < 2:
+            statuses[board_num] = BATCH_BUDGET
+        elif num_solutions == 1:
+            statuses[board_num] = BATCH_SOLVED
+            solutions[board_num] = numpy.frombuffer(bytes(solver.getSolutionGrid().cells), dtype=numpy.uint8)
+        elif num_solutions > 1:
+            statuses[board_num] = BATCH_MULTIPLE
+
+    solutions[statuses != BATCH_SOLVED] = 0
+    return (solutions, statuses)
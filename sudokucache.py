@@ -0,0 +1,183 @@
+#!/usr/bin/python
+import os
+import struct
+import collections
+import sudokupuzzle
+import sudokuformat
+
+
+# file header: magic, format version, box size, record size
+CACHE_MAGIC = b'SUDOKUCR'
+CACHE_VERSION = 1
+CACHE_HEADER = struct.Struct('<8sHHH10x')
+# record flags byte: number of stored solutions (0-2) in the low bits, plus this bit when that is every solution
+RECORD_COMPLETE_FLAG = 0x80
+# solutions kept per entry, enough to tell none, single, and multiple apart
+MAX_CACHED_SOLUTIONS = 2
+
+
+def getRelabelTables(cells, shape):
+    # (table to canonical values, table back) for bytes.translate, values are renumbered in order of first
+    #   appearance (values that never appear follow in their own order) so relabeled copies of a grid match
+    num_cells = shape.num_cells
+    first_positions = [cells.find(value) for value in range(shape.size + 1)]
+    values = sorted(
+        range(1, shape.size + 1),
+        key=lambda value: first_positions[value] if first_positions[value] >= 0 else num_cells + value,
+    )
+    to_table = bytearray(range(256))
+    from_table = bytearray(range(256))
+    for (j, value) in enumerate(values):
+        to_table[value] = j + 1
+        from_table[j + 1] = value
+    return (bytes(to_table), bytes(from_table))
+
+
+class SudokuResultCache:
+    # bounded LRU cache of solver results (the first solutions of a grid, and whether they are all of them) for
+    #   grids of one box size, keyed by the packed grid values
+    # canonical keys also match grids that only differ by relabeling values or transposing, solutions are mapped
+    #   back to the asking grid's values and orientation on a hit
+    # solvers given a result cache look every solve/count up here first and store what they find
+    def __init__(self, max_entries = 65536, is_canonical = False, box_size = 3):
+        self.max_entries = max_entries
+        self.is_canonical = is_canonical
+        self.shape = sudokupuzzle.getGridShape(box_size)
+        self.packed_size = sudokuformat.getPackedSize(self.shape)
+        # key -> (packed canonical solutions, is complete), least recently used first
+        self.entries = collections.OrderedDict()
+        self.num_hits = 0
+        self.num_misses = 0
+        self.num_stores = 0
+        self.num_evictions = 0
+
+    def getStats(self):
+        num_lookups = self.num_hits + self.num_misses
+        return {
+            'entries': len(self.entries),
+            'hits': self.num_hits,
+            'misses': self.num_misses,
+            'stores': self.num_stores,
+            'evictions': self.num_evictions,
+            'hit_rate': round(self.num_hits / num_lookups, 4) if num_lookups else 0.0,
+        }
+
+    def lookup(self, grid, limit = None):
+        # returns (cache key, solutions), solutions is a list of up to limit solution value strings when the
+        #   cache knows enough to answer, None otherwise
+        # the cache key is passed back to store once the solver has searched
+        if grid.shape is not self.shape:
+            raise ValueError('Result cache holds %dx%d grids' % (self.shape.size, self.shape.size))
+        cache_key = self._getCacheKey(bytes(grid.cells))
+        entry = self.entries.get(cache_key[0])
+        if entry is not None and (entry[1] or (limit is not None and len(entry[0]) >= limit)):
+            self.entries.move_to_end(cache_key[0])
+            self.num_hits += 1
+            packed_solutions = entry[0] if limit is None else entry[0][:limit]
+            return (cache_key, [
+                self._fromCanonical(sudokuformat.unpackCells(packed_solution, self.shape), cache_key)
+                for packed_solution in packed_solutions
+            ])
+        self.num_misses += 1
+        return (cache_key, None)
+
+    def store(self, cache_key, solutions, num_solutions, limit, search_status):
+        # the first solutions (at least MAX_CACHED_SOLUTIONS of them when there are that many) of num_solutions
+        #   found by a search of at most limit solutions that ended with search_status, a search that ran out of
+        #   budget still stores the solutions it found
+        is_complete = (
+            search_status == sudokupuzzle.SEARCH_DONE and
+            (limit is None or num_solutions < limit) and
+            num_solutions <= MAX_CACHED_SOLUTIONS
+        )
+        packed_solutions = tuple(
+            sudokuformat.packCells(self._toCanonical(solution, cache_key), self.shape)
+            for solution in solutions[:MAX_CACHED_SOLUTIONS]
+        )
+        entry = self.entries.get(cache_key[0])
+        if entry is not None and (entry[1] or len(entry[0]) >= len(packed_solutions)) and not is_complete:
+            # never replace what is known with less
+            return
+        self._putEntry(cache_key[0], (packed_solutions, is_complete))
+        self.num_stores += 1
+
+    def clear(self):
+        self.entries.clear()
+        return self
+
+    def load(self, cache_path):
+        # adds the entries saved in a cache file (a missing file adds nothing), the cache keeps its own size limit
+        if not os.path.exists(cache_path):
+            return self
+        record = self._getRecordStruct()
+        with open(cache_path, 'rb') as cache_file:
+            data = cache_file.read()
+        if len(data) < CACHE_HEADER.size:
+            raise ValueError('Not a result cache file: %s' % cache_path)
+        (magic, version, box_size, record_size) = CACHE_HEADER.unpack_from(data, 0)
+        if magic != CACHE_MAGIC or version != CACHE_VERSION or box_size != self.shape.box_size or \
+                record_size != record.size:
+            raise ValueError('Not a %dx%d result cache file: %s' % (self.shape.size, self.shape.size, cache_path))
+
+        # canonical and plain keys can not be told apart, the file is trusted to match is_canonical
+        for offset in range(CACHE_HEADER.size, len(data) - record.size + 1, record.size):
+            (key, flags, first_solution, second_solution) = record.unpack_from(data, offset)
+            num_solutions = flags & ~RECORD_COMPLETE_FLAG
+            packed_solutions = (first_solution, second_solution)[:num_solutions]
+            self._putEntry(key, (packed_solutions, bool(flags & RECORD_COMPLETE_FLAG)))
+        return self
+
+    def save(self, cache_path):
+        # writes every entry, least recently used first, replacing the file in one step
+        record = self._getRecordStruct()
+        empty_solution = bytes(self.packed_size)
+        temp_path = cache_path + '.tmp'
+        with open(temp_path, 'wb') as cache_file:
+            cache_file.write(CACHE_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, self.shape.box_size, record.size))
+            for (key, (packed_solutions, is_complete)) in self.entries.items():
+                padded_solutions = packed_solutions + (empty_solution,) * (
+                    MAX_CACHED_SOLUTIONS - len(packed_solutions)
+                )
+                flags = len(packed_solutions) | (RECORD_COMPLETE_FLAG if is_complete else 0)
+                cache_file.write(record.pack(key, flags, *padded_solutions))
+        os.replace(temp_path, cache_path)
+        return self
+
+    def _getRecordStruct(self):
+        # record: key, flags, the solution slots, each grid packed the same way as sudokuformat records
+        return struct.Struct('<%dsB%ds%ds' % (self.packed_size, self.packed_size, self.packed_size))
+
+    def _putEntry(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.num_evictions += 1
+
+    def _getCacheKey(self, cells):
+        # (key, is transposed, relabel table, relabel back table)
+        if not self.is_canonical:
+            return (sudokuformat.packCells(cells, self.shape), False, None, None)
+        transposed_cells = bytes(map(cells.__getitem__, self.shape.column_order_cells))
+        candidates = []
+        for (candidate_cells, is_transposed) in ((cells, False), (transposed_cells, True)):
+            (to_table, from_table) = getRelabelTables(candidate_cells, self.shape)
+            candidates.append((candidate_cells.translate(to_table), is_transposed, to_table, from_table))
+        (canonical_cells, is_transposed, to_table, from_table) = min(candidates)
+        return (sudokuformat.packCells(canonical_cells, self.shape), is_transposed, to_table, from_table)
+
+    def _toCanonical(self, cells, cache_key):
+        (key, is_transposed, to_table, from_table) = cache_key
+        cells = bytes(cells)
+        if is_transposed:
+            cells = bytes(map(cells.__getitem__, self.shape.column_order_cells))
+        return cells.translate(to_table) if to_table is not None else cells
+
+    def _fromCanonical(self, cells, cache_key):
+        (key, is_transposed, to_table, from_table) = cache_key
+        if from_table is not None:
+            cells = cells.translate(from_table)
+        if is_transposed:
+            # transposing twice gives back the original orientation
+            cells = bytes(map(cells.__getitem__, self.shape.column_order_cells))
+        return cells
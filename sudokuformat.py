@@ -0,0 +1,206 @@
+#!/usr/bin/python
+import os
+import mmap
+import struct
+import sudokupuzzle
+
+
+# file header: magic, format version, box size, record size
+RECORD_MAGIC = b'SUDOKUPF'
+RECORD_VERSION = 1
+RECORD_HEADER = struct.Struct('<8sHHH10x')
+# record status codes, named the same as the sudoku-solver.py stream statuses ('unknown' before solving)
+RECORD_UNKNOWN = 0
+RECORD_SOLVED = 1
+RECORD_UNSOLVABLE = 2
+RECORD_MULTIPLE = 3
+RECORD_INVALID = 4
+RECORD_BUDGET = 5
+RECORD_STATUS_NAMES = ['unknown', 'solved', 'unsolvable', 'multiple', 'invalid', 'budget']
+# difficulty byte of records without one
+NO_DIFFICULTY = 0xff
+
+# lookups of packed byte -> value in its high 4 bits, and in its low 4 bits, for bytes.translate
+HIGH_VALUE_TABLE = bytes(byte >> 4 for byte in range(256))
+LOW_VALUE_TABLE = bytes(byte & 0x0f for byte in range(256))
+
+
+def getPackedSize(shape):
+    # grids with values up to 15 pack 2 positions per byte, bigger ones keep a byte per position
+    if shape.size <= 15:
+        return (shape.num_cells + 1) // 2
+    return shape.num_cells
+
+
+def packCells(cells, shape):
+    # values listed row by row (0 for empty positions) -> packed bytes, high 4 bits first
+    if shape.size > 15:
+        return bytes(cells)
+    packed_size = getPackedSize(shape)
+    cells = bytes(cells) + bytes(packed_size * 2 - len(cells))
+    # every value fits in 4 bits, so shifting the high values of all bytes at once never carries into the
+    #   next byte
+    return (
+        (int.from_bytes(cells[0::2], 'big') << 4) | int.from_bytes(cells[1::2], 'big')
+    ).to_bytes(packed_size, 'big')
+
+
+def unpackCells(packed_cells, shape):
+    # packed bytes (any bytes-like, a memoryview or mmap slice included) -> values listed row by row
+    if shape.size > 15:
+        return bytes(packed_cells)
+    packed_cells = bytes(packed_cells)
+    cells = bytearray(len(packed_cells) * 2)
+    cells[0::2] = packed_cells.translate(HIGH_VALUE_TABLE)
+    cells[1::2] = packed_cells.translate(LOW_VALUE_TABLE)
+    return bytes(cells[:shape.num_cells])
+
+
+def getCellsString(cells, shape):
+    # values listed row by row -> puzzle string in one translate, '.' for empty positions and '?' for values
+    #   too big for the shape
+    table = ('.' + shape.value_chars).encode('ascii').ljust(256, b'?')
+    return bytes(cells).translate(table).decode('ascii')
+
+
+def getRecordStruct(shape):
+    # record: clue grid, solution grid (all empty when unknown), difficulty, status, clue count
+    packed_size = getPackedSize(shape)
+    return struct.Struct('<%ds%dsBBH' % (packed_size, packed_size))
+
+
+def packRecord(shape, clue_cells, solution_cells = None, difficulty = None, status = RECORD_UNKNOWN):
+    record = getRecordStruct(shape)
+    if solution_cells is None:
+        solution_cells = bytes(shape.num_cells)
+    return record.pack(
+        packCells(clue_cells, shape),
+        packCells(solution_cells, shape),
+        NO_DIFFICULTY if difficulty is None else difficulty,
+        status,
+        shape.num_cells - bytes(clue_cells).count(0),
+    )
+
+
+def unpackRecord(shape, buffer, offset = 0):
+    # returns (clue values, solution values or None when unknown, difficulty or None, status) of the record
+    #   at offset, values listed row by row
+    (packed_clues, packed_solution, difficulty, status, clue_count) = getRecordStruct(shape).unpack_from(
+        buffer, offset
+    )
+    solution_cells = unpackCells(packed_solution, shape)
+    return (
+        unpackCells(packed_clues, shape),
+        solution_cells if solution_cells.count(0) != len(solution_cells) else None,
+        None if difficulty == NO_DIFFICULTY else difficulty,
+        status,
+    )
+
+
+def isRecordFile(path):
+    with open(path, 'rb') as record_file:
+        return record_file.read(len(RECORD_MAGIC)) == RECORD_MAGIC
+
+
+class SudokuRecordWriter:
+    # writes a packed puzzle file: a header, then one fixed size record per puzzle with its clue grid, solution
+    #   grid, difficulty, and solver status, grids packed 4 bits per position (a byte per position for grids
+    #   with values over 15)
+    def __init__(self, output_file, box_size = 3):
+        # output_file is any binary file object, the header is written straight away
+        self.output_file = output_file
+        self.shape = sudokupuzzle.getGridShape(box_size)
+        self.record = getRecordStruct(self.shape)
+        self.record_count = 0
+        output_file.write(RECORD_HEADER.pack(RECORD_MAGIC, RECORD_VERSION, box_size, self.record.size))
+
+    def writeRecord(self, clue_grid, solved_grid = None, difficulty = None, status = RECORD_UNKNOWN):
+        self.writePackedRecords(packRecord(
+            self.shape, clue_grid.cells, solved_grid.cells if solved_grid is not None else None, difficulty,
+            status,
+        ))
+        return self
+
+    def writePackedRecords(self, packed_records):
+        # already packed records (from packRecord or a record reader), any number of them back to back
+        if len(packed_records) % self.record.size:
+            raise ValueError('Packed records are not a whole number of %d byte records' % self.record.size)
+        self.output_file.write(packed_records)
+        self.record_count += len(packed_records) // self.record.size
+        return self
+
+
+class SudokuRecordReader:
+    # reads a packed puzzle file in place, from a path (memory mapped) or any bytes-like buffer (bytes,
+    #   memoryview, mmap), records are only unpacked when asked for
+    def __init__(self, source):
+        self.record_map = None
+        if isinstance(source, str):
+            with open(source, 'rb') as record_file:
+                if os.fstat(record_file.fileno()).st_size == 0:
+                    raise ValueError('Not a packed puzzle file: %s' % source)
+                self.record_map = mmap.mmap(record_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.buffer = memoryview(self.record_map)
+        else:
+            self.buffer = memoryview(source)
+
+        if len(self.buffer) < RECORD_HEADER.size:
+            self.close()
+            raise ValueError('Not a packed puzzle file')
+        (magic, version, box_size, record_size) = RECORD_HEADER.unpack_from(self.buffer, 0)
+        if magic != RECORD_MAGIC or version != RECORD_VERSION or box_size not in sudokupuzzle.GRID_BOX_SIZES:
+            self.close()
+            raise ValueError('Not a packed puzzle file')
+        self.shape = sudokupuzzle.getGridShape(box_size)
+        self.record = getRecordStruct(self.shape)
+        if record_size != self.record.size:
+            self.close()
+            raise ValueError('Not a packed puzzle file')
+        # a partially written record at the end is left out
+        self.record_count = (len(self.buffer) - RECORD_HEADER.size) // self.record.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def getCount(self):
+        return self.record_count
+
+    def getRecordCells(self, record_num):
+        # returns (clue values, solution values or None, difficulty or None, status)
+        return unpackRecord(self.shape, self.buffer, RECORD_HEADER.size + record_num * self.record.size)
+
+    def getRecord(self, record_num):
+        # returns (clue grid, solved grid or None, difficulty or None, status)
+        (clue_cells, solution_cells, difficulty, status) = self.getRecordCells(record_num)
+        clue_grid = sudokupuzzle.SudokuGrid(self.shape.box_size).seedFromCells(clue_cells)
+        solved_grid = None
+        if solution_cells is not None:
+            solved_grid = sudokupuzzle.SudokuGrid(self.shape.box_size).seedFromCells(solution_cells)
+        return (clue_grid, solved_grid, difficulty, status)
+
+    def iterRecords(self, start = 0, stop = None):
+        for record_num in range(start, self.record_count if stop is None else min(stop, self.record_count)):
+            yield self.getRecord(record_num)
+
+    def getPackedRecords(self, start = 0, stop = None):
+        # records start to stop still packed, as a memoryview into the file
+        stop = self.record_count if stop is None else min(stop, self.record_count)
+        return self.buffer[
+            RECORD_HEADER.size + start * self.record.size:RECORD_HEADER.size + max(start, stop) * self.record.size
+        ]
+
+    def getDifficulties(self):
+        # difficulty byte of every record (NO_DIFFICULTY for none) in one strided slice
+        first_offset = RECORD_HEADER.size + getPackedSize(self.shape) * 2
+        return bytes(self.buffer[first_offset:RECORD_HEADER.size + self.record_count * self.record.size:
+                                 self.record.size])
+
+    def close(self):
+        # views handed out by getPackedRecords must be released before closing a memory mapped file
+        self.buffer.release()
+        if self.record_map is not None:
+            self.record_map.close()
+            self.record_map = None
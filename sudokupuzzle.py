@@ -1,18 +1,593 @@
 #!/usr/bin/python
-import math
 import random
 import time
-import re
 
 
-class SudokuSolver:
+# characters used for values 1-25 in puzzle strings (grids larger than 9x9 continue with letters)
+GRID_VALUE_CHARS = '123456789ABCDEFGHIJKLMNOP'
+
+
+class SudokuMaskLookup(dict):
+    # mask -> function(mask) lookup filled in on first use, for grids with too many values to tabulate every
+    #   mask up front
+    def __init__(self, function):
+        dict.__init__(self)
+        self.function = function
+
+    def __missing__(self, mask):
+        result = self[mask] = self.function(mask)
+        return result
+
+
+class SudokuGridShape:
+    # lookup tables for one grid size: box_size x box_size subgrids of box_size x box_size positions each,
+    #   holding the values 1 to box_size ** 2 (the standard 9x9 grid has box_size 3)
+    # bit n of a value mask represents value n (bit 0 unused so value n maps directly to 1 << n)
+    def __init__(self, box_size):
+        size = box_size * box_size
+        num_cells = size * size
+        self.box_size = box_size
+        self.size = size
+        self.num_cells = num_cells
+        self.all_values_mask = ((1 << size) - 1) << 1
+        self.value_chars = GRID_VALUE_CHARS[:size]
+
+        # lookup of mask -> list of values whose bits are set in the mask, and -> number of those values
+        def getMaskValues(mask):
+            return [value for value in range(1, size + 1) if mask & (1 << value)]
+        if size <= 9:
+            # each mask extends the values of the mask without its highest bit (bit 0 holds no value)
+            self.mask_values = [[]]
+            for mask in range(1, 1 << (size + 1)):
+                high_value = mask.bit_length() - 1
+                lower_values = self.mask_values[mask ^ (1 << high_value)]
+                self.mask_values.append(lower_values + [high_value] if high_value else lower_values)
+            self.mask_bit_counts = [len(values) for values in self.mask_values]
+        else:
+            self.mask_values = SudokuMaskLookup(getMaskValues)
+            self.mask_bit_counts = SudokuMaskLookup(lambda mask: bin(mask).count('1'))
+
+        # cell index (row * size + col) lookups
+        self.cell_row = [i // size for i in range(num_cells)]
+        self.cell_col = [i % size for i in range(num_cells)]
+        self.cell_subgrid = [
+            (i // (size * box_size)) * box_size + (i % size) // box_size for i in range(num_cells)
+        ]
+        self.subgrid_cells = [
+            [i for i in range(num_cells) if self.cell_subgrid[i] == subgrid_num] for subgrid_num in range(size)
+        ]
+        # cell indexes ordered col by col, the order used when searching for values
+        self.column_order_cells = [y * size + x for x in range(size) for y in range(size)]
+        # cell indexes of each row, col, and subgrid (the units that must each hold every value once)
+        self.unit_cells = (
+            [[row * size + col for col in range(size)] for row in range(size)] +
+            [[row * size + col for row in range(size)] for col in range(size)] +
+            self.subgrid_cells
+        )
+        # per cell index, the cells of its row, col, and subgrid, each without the cell itself
+        self.cell_units = [
+            (
+                tuple(j for j in self.unit_cells[self.cell_row[i]] if j != i),
+                tuple(j for j in self.unit_cells[size + self.cell_col[i]] if j != i),
+                tuple(j for j in self.unit_cells[size * 2 + self.cell_subgrid[i]] if j != i),
+            )
+            for i in range(num_cells)
+        ]
+
+
+# box sizes with enough value characters to display, 4x4 up to 25x25 grids
+GRID_BOX_SIZES = (2, 3, 4, 5)
+# shapes by box size, built on first use
+GRID_SHAPES = {}
+
+
+def getGridShape(box_size):
+    if box_size not in GRID_SHAPES:
+        if box_size not in GRID_BOX_SIZES:
+            raise ValueError('Unsupported box size: %s' % box_size)
+        GRID_SHAPES[box_size] = SudokuGridShape(box_size)
+    return GRID_SHAPES[box_size]
+
+
+# lookups of the standard 9x9 grid
+STANDARD_GRID_SHAPE = getGridShape(3)
+ALL_VALUES_MASK = STANDARD_GRID_SHAPE.all_values_mask
+MASK_VALUES = STANDARD_GRID_SHAPE.mask_values
+MASK_BIT_COUNTS = STANDARD_GRID_SHAPE.mask_bit_counts
+CELL_ROW = STANDARD_GRID_SHAPE.cell_row
+CELL_COL = STANDARD_GRID_SHAPE.cell_col
+CELL_SUBGRID = STANDARD_GRID_SHAPE.cell_subgrid
+SUBGRID_CELLS = STANDARD_GRID_SHAPE.subgrid_cells
+COLUMN_ORDER_CELLS = STANDARD_GRID_SHAPE.column_order_cells
+UNIT_CELLS = STANDARD_GRID_SHAPE.unit_cells
+
+# SudokuSolver search states
+SEARCH_DONE = 'done'
+SEARCH_PAUSED = 'paused'
+# stopped at a solution, resuming moves on to the next one
+SEARCH_FOUND = 'found'
+
+# SudokuPuzzle generation states
+GENERATE_PENDING = 'pending'
+# the hidden numbers grid meets the requested criteria
+GENERATE_DONE = 'done'
+# the budget ran out, the hidden numbers grid is the valid puzzle with the fewest clues found before then
+GENERATE_DEGRADED = 'degraded'
+# the budget ran out before any number could be hidden (or before a solved grid was seeded)
+GENERATE_OUT_OF_BUDGET = 'budget'
+# the criteria were out of reach from the solved grid within max_hide_attempts attempts
+GENERATE_GAVE_UP = 'gave_up'
+
+
+def getPercentile(sorted_values, percentile):
+    # nearest rank percentile of an already sorted list, for the latency summaries of the scripts
+    index = int(round((len(sorted_values) - 1) * percentile / 100.0))
+    return sorted_values[index]
+
+
+class SudokuSolverStats:
+    # search counters filled in by a solver created with collect_stats=True (solvers skip all counting when off)
     def __init__(self):
+        self.nodes_visited = 0
+        self.max_depth = 0
+        self.propagation_passes = 0
+        self.forced_singles = 0
+        # depth -> [branch points at that depth, values tried across them]
+        self.branch_counts = {}
+        self.copies_made = 0
+        self.candidate_time = 0.0
+
+    def addBranchPoint(self, depth, num_values_tried):
+        branch_count = self.branch_counts.setdefault(depth, [0, 0])
+        branch_count[0] += 1
+        branch_count[1] += num_values_tried
+
+    def toDict(self):
+        return {
+            'nodes_visited': self.nodes_visited,
+            'max_depth': self.max_depth,
+            'propagation_passes': self.propagation_passes,
+            'forced_singles': self.forced_singles,
+            # average values tried per branch point, indexed by depth (None where no branching happened)
+            'branch_factor_per_level': [
+                round(self.branch_counts[depth][1] / float(self.branch_counts[depth][0]), 3)
+                if depth in self.branch_counts else None
+                for depth in range(max(self.branch_counts) + 1 if self.branch_counts else 0)
+            ],
+            'copies_made': self.copies_made,
+            'candidate_time_ms': round(self.candidate_time * 1000, 3),
+        }
+
+
+# optional propagation techniques, naked singles are always applied
+PROPAGATION_TECHNIQUES = ('hidden_singles', 'naked_pairs', 'pointing_pairs')
+
+
+class SudokuPropagator:
+    # deduction pipeline run on a grid at every search node, placements and eliminations are made through the
+    #   grid (so they land on its trail and get undone on backtrack)
+    # cheaper techniques run first, a technique only runs once every earlier one has stopped making progress
+    def __init__(self, techniques = PROPAGATION_TECHNIQUES):
+        self.techniques = tuple(techniques)
+        self.technique_functions = []
+        for technique in self.techniques:
+            if technique not in PROPAGATION_TECHNIQUES:
+                raise ValueError('Unknown propagation technique: %s' % technique)
+            self.technique_functions.append(self.getTechniqueFunction(technique))
+
+    def getTechniqueFunction(self, technique):
+        # function(grid, stats) applying one pass of the technique, returns the number of placements or
+        #   eliminations made, None if the grid was found to have no solution
+        return {
+            'naked_singles': self._applyNakedSingles,
+            'hidden_singles': self._applyHiddenSingles,
+            'naked_pairs': self._applyNakedPairs,
+            'pointing_pairs': self._applyPointingPairs,
+        }[technique]
+
+    def propagate(self, grid, stats = None):
+        # returns False if the grid was found to have no solution
+        while True:
+            if stats is not None:
+                stats.propagation_passes += 1
+            num_changes = self._applyNakedSingles(grid, stats)
+            if num_changes is None:
+                return False
+            if num_changes:
+                continue
+            for technique_function in self.technique_functions:
+                num_changes = technique_function(grid, stats)
+                if num_changes is None:
+                    return False
+                if num_changes:
+                    break
+            if not num_changes:
+                return True
+
+    def _applyNakedSingles(self, grid, stats):
+        # place every position with only one candidate, None if any position has none
+        # (candidate masks are worked out inline, this and hidden singles are the hottest loops of every search)
+        cells = grid.cells
+        shape = grid.shape
+        (cell_row, cell_col, cell_subgrid) = (shape.cell_row, shape.cell_col, shape.cell_subgrid)
+        (row_masks, col_masks, subgrid_masks) = (grid.row_masks, grid.col_masks, grid.subgrid_masks)
+        eliminated_masks = grid.eliminated_masks
+        all_values_mask = shape.all_values_mask
+        num_placed = 0
+        for i in range(shape.num_cells):
+            if cells[i]:
+                continue
+            candidate_mask = all_values_mask & ~(
+                row_masks[cell_row[i]] | col_masks[cell_col[i]] | subgrid_masks[cell_subgrid[i]] |
+                eliminated_masks[i]
+            )
+            if not candidate_mask & (candidate_mask - 1):
+                if not candidate_mask:
+                    return None
+                grid._setCellValue(i, candidate_mask.bit_length() - 1)
+                num_placed += 1
+        if stats is not None:
+            stats.forced_singles += num_placed
+        return num_placed
+
+    def _applyHiddenSingles(self, grid, stats):
+        # place every value with only one possible position in a row, col, or subgrid
+        cells = grid.cells
+        shape = grid.shape
+        (cell_row, cell_col, cell_subgrid) = (shape.cell_row, shape.cell_col, shape.cell_subgrid)
+        (row_masks, col_masks, subgrid_masks) = (grid.row_masks, grid.col_masks, grid.subgrid_masks)
+        eliminated_masks = grid.eliminated_masks
+        all_values_mask = shape.all_values_mask
+        num_placed = 0
+        for unit in shape.unit_cells:
+            placed_mask = 0
+            seen_once_mask = 0
+            seen_twice_mask = 0
+            for i in unit:
+                if cells[i]:
+                    placed_mask |= 1 << cells[i]
+                else:
+                    candidate_mask = all_values_mask & ~(
+                        row_masks[cell_row[i]] | col_masks[cell_col[i]] | subgrid_masks[cell_subgrid[i]] |
+                        eliminated_masks[i]
+                    )
+                    seen_twice_mask |= seen_once_mask & candidate_mask
+                    seen_once_mask |= candidate_mask
+            if (placed_mask | seen_once_mask) != all_values_mask:
+                # a value has nowhere left to go in this unit
+                return None
+            single_mask = seen_once_mask & ~seen_twice_mask
+            if single_mask:
+                for i in unit:
+                    if cells[i]:
+                        continue
+                    position_single_mask = grid.getCellCandidateMask(i) & single_mask
+                    if position_single_mask:
+                        if position_single_mask & (position_single_mask - 1):
+                            # two values both need this position
+                            return None
+                        grid._setCellValue(i, position_single_mask.bit_length() - 1)
+                        num_placed += 1
+        if stats is not None:
+            stats.forced_singles += num_placed
+        return num_placed
+
+    def _applyNakedPairs(self, grid, stats):
+        # two positions in a unit sharing the same two candidates rule those values out of the rest of the unit
+        cells = grid.cells
+        mask_bit_counts = grid.shape.mask_bit_counts
+        num_eliminated = 0
+        for unit in grid.shape.unit_cells:
+            pair_positions = {}
+            for i in unit:
+                if cells[i]:
+                    continue
+                candidate_mask = grid.getCellCandidateMask(i)
+                if mask_bit_counts[candidate_mask] != 2:
+                    continue
+                if candidate_mask not in pair_positions:
+                    pair_positions[candidate_mask] = i
+                    continue
+                for j in unit:
+                    if cells[j] or j == i or j == pair_positions[candidate_mask]:
+                        continue
+                    eliminate_mask = grid.getCellCandidateMask(j) & candidate_mask
+                    if eliminate_mask:
+                        grid._eliminateCellValues(j, eliminate_mask)
+                        num_eliminated += 1
+        return num_eliminated
+
+    def _applyPointingPairs(self, grid, stats):
+        # a value whose candidates in a subgrid all sit in one row (or col) is ruled out of the rest of that row
+        cells = grid.cells
+        shape = grid.shape
+        box_size = shape.box_size
+        num_eliminated = 0
+        for (subgrid_num, subgrid_cells) in enumerate(shape.subgrid_cells):
+            row_candidate_masks = [0] * box_size
+            col_candidate_masks = [0] * box_size
+            for i in subgrid_cells:
+                if not cells[i]:
+                    candidate_mask = grid.getCellCandidateMask(i)
+                    row_candidate_masks[shape.cell_row[i] % box_size] |= candidate_mask
+                    col_candidate_masks[shape.cell_col[i] % box_size] |= candidate_mask
+            for (line_candidate_masks, first_line, unit_offset) in (
+                (row_candidate_masks, (subgrid_num // box_size) * box_size, 0),
+                (col_candidate_masks, (subgrid_num % box_size) * box_size, shape.size),
+            ):
+                for k in range(box_size):
+                    other_lines_mask = 0
+                    for (other_k, line_candidate_mask) in enumerate(line_candidate_masks):
+                        if other_k != k:
+                            other_lines_mask |= line_candidate_mask
+                    pointing_mask = line_candidate_masks[k] & ~other_lines_mask
+                    if not pointing_mask:
+                        continue
+                    for j in shape.unit_cells[unit_offset + first_line + k]:
+                        if cells[j] or shape.cell_subgrid[j] == subgrid_num:
+                            continue
+                        eliminate_mask = grid.getCellCandidateMask(j) & pointing_mask
+                        if eliminate_mask:
+                            grid._eliminateCellValues(j, eliminate_mask)
+                            num_eliminated += 1
+        return num_eliminated
+
+
+class SudokuSolver:
+    # depth first search over an explicit stack of branch frames, so a search can be paused (for example by a
+    #   node budget) and resumed later without any recursion
+    # each frame is [branch position index, mask of values still to try, trail mark to undo to, values tried]
+    def __init__(self, collect_stats = False, node_budget = None, propagator = None, result_cache = None):
         self.found_solutions = []
+        self.stats = SudokuSolverStats() if collect_stats else None
+        # max search nodes for each check/count call, None for no limit
+        self.node_budget = node_budget
+        # SudokuPropagator run at every search node
+        self.propagator = propagator if propagator is not None else SudokuPropagator()
+        # optional sudokucache.SudokuResultCache checked before every search (results do not depend on the solver)
+        self.result_cache = result_cache
+        self.search_status = SEARCH_DONE
+        self.search_grid = None
+        self.search_stack = []
+        self.search_has_pending_node = False
+        # nodes visited since startSearch, the node budget applies to this total
+        self.search_num_nodes = 0
+        # nodes visited over every search since the solver was created (cached results visit none)
+        self.total_num_nodes = 0
+
+    def getStats(self):
+        # counters accumulated over every search since the solver was created, None unless collecting
+        return self.stats
 
     def checkHasSingleSolution(self, base_grid):
+        # False if the node budget ran out before the search could prove a single solution
+        self.findSolutions(base_grid)
+        return (self.search_status == SEARCH_DONE and len(self.found_solutions) == 1)
+
+    def checkHasAnySolution(self, base_grid):
+        # stops at the first solution found
+        self.found_solutions = list(self.iterSolutions(base_grid, 1))
+        return len(self.found_solutions) > 0
+
+    def getSolutionGrid(self):
+        if len(self.found_solutions) == 1:
+            return self.found_solutions[0]
+        else:
+            return None
+
+    def getAllSolutionCount(self, base_grid):
+        # only a lower bound if the node budget ran out (search_status is left as SEARCH_PAUSED)
+        self.found_solutions = []
+        return self.countSolutions(base_grid)
+
+    def findSolutions(self, base_grid, find_all_solutions = False):
+        self.found_solutions = list(self.iterSolutions(base_grid, None if find_all_solutions else 2))
+        return self.search_status
+
+    def iterSolutions(self, base_grid, limit = None):
+        # yields a copy of each solution grid as it is found, at most limit of them, stops early if the node
+        #   budget runs out (search_status is then left as SEARCH_PAUSED)
+        if self.result_cache is None:
+            for grid in self._iterSolutionGrids(base_grid, limit):
+                if self.stats is not None:
+                    self.stats.copies_made += 1
+                yield grid.getCopy()
+            return
+
+        (cache_key, cached_solutions) = self.result_cache.lookup(base_grid, limit)
+        if cached_solutions is not None:
+            self.search_status = SEARCH_DONE
+            for solution in cached_solutions:
+                yield SudokuGrid(base_grid.shape.box_size).seedFromValues(solution)
+            return
+        # only the first solutions (sudokucache.MAX_CACHED_SOLUTIONS) are kept for the cache, so memory use still
+        #   only grows with the search depth, a search that found more is not cached
+        solutions = []
+        num_solutions = 0
+        for grid in self._iterSolutionGrids(base_grid, limit):
+            if self.stats is not None:
+                self.stats.copies_made += 1
+            if num_solutions < 2:
+                solutions.append(bytes(grid.cells))
+            num_solutions += 1
+            yield grid.getCopy()
+        if num_solutions <= 2:
+            self.result_cache.store(cache_key, solutions, num_solutions, limit, self.search_status)
+
+    def countSolutions(self, base_grid, limit = None):
+        # number of solutions (up to limit) without building any solution grids, memory use only grows with
+        #   the search depth, only a lower bound if the node budget ran out
+        if self.result_cache is None:
+            num_solutions = 0
+            for grid in self._iterSolutionGrids(base_grid, limit):
+                num_solutions += 1
+            return num_solutions
+
+        (cache_key, cached_solutions) = self.result_cache.lookup(base_grid, limit)
+        if cached_solutions is not None:
+            self.search_status = SEARCH_DONE
+            return len(cached_solutions)
+        # only the first solutions are kept for the cache
+        solutions = []
+        num_solutions = 0
+        for grid in self._iterSolutionGrids(base_grid, limit):
+            if num_solutions < 2:
+                solutions.append(bytes(grid.cells))
+            num_solutions += 1
+        self.result_cache.store(cache_key, solutions, num_solutions, limit, self.search_status)
+        return num_solutions
+
+    def _iterSolutionGrids(self, base_grid, limit):
+        # yields the search grid itself at each solution, it changes as soon as the next solution is asked for
+        self.startSearch(base_grid)
+        num_solutions = 0
+        while True:
+            if limit is not None and num_solutions >= limit:
+                # enough solutions found, can stop searching
+                self._finishSearch()
+                return
+            max_nodes = None
+            if self.node_budget is not None:
+                max_nodes = max(0, self.node_budget - self.search_num_nodes)
+            if self.resumeSearch(max_nodes) != SEARCH_FOUND:
+                return
+            num_solutions += 1
+            yield self.search_grid
+
+    def startSearch(self, base_grid):
+        # work on a private copy, backtracking is done by undoing its trail instead of copying
+        self.search_grid = base_grid.getCopy()
+        self.search_grid.getTrailMark()
+        if self.stats is not None:
+            self.stats.copies_made += 1
+        self.search_stack = []
+        self.search_has_pending_node = True
+        self.search_status = SEARCH_PAUSED
+        self.search_num_nodes = 0
+        return self
+
+    def resumeSearch(self, max_nodes = None):
+        # runs the search until it is done, it finds a solution (SEARCH_FOUND, the solution is left in
+        #   search_grid), or max_nodes more nodes have been visited, returns the search status
+        if self.search_status == SEARCH_DONE:
+            return self.search_status
+        self.search_status = SEARCH_PAUSED
+
+        grid = self.search_grid
+        cells = grid.cells
+        shape = grid.shape
+        (cell_row, cell_col, cell_subgrid) = (shape.cell_row, shape.cell_col, shape.cell_subgrid)
+        (row_masks, col_masks, subgrid_masks) = (grid.row_masks, grid.col_masks, grid.subgrid_masks)
+        eliminated_masks = grid.eliminated_masks
+        all_values_mask = shape.all_values_mask
+        mask_bit_counts = shape.mask_bit_counts
+        num_cells = shape.num_cells
+        stack = self.search_stack
+        stats = self.stats
+        num_nodes = 0
+
+        while True:
+            if self.search_has_pending_node:
+                if max_nodes is not None and num_nodes >= max_nodes:
+                    # out of budget, the pending node is visited first when resumed
+                    return self.search_status
+                self.search_has_pending_node = False
+                num_nodes += 1
+                self.search_num_nodes += 1
+                self.total_num_nodes += 1
+                if stats is not None:
+                    stats.nodes_visited += 1
+                    if len(stack) > stats.max_depth:
+                        stats.max_depth = len(stack)
+
+                if stats is not None:
+                    candidate_start_time = time.perf_counter()
+                if self.propagator.propagate(grid, stats):
+                    # every empty position is now left with at least 2 candidates, pick the one with the fewest
+                    fewest_possibilities = num_cells
+                    fewest_possibility_i = None
+                    for i in range(num_cells):
+                        if cells[i]:
+                            continue
+                        candidate_mask = all_values_mask & ~(
+                            row_masks[cell_row[i]] | col_masks[cell_col[i]] | subgrid_masks[cell_subgrid[i]] |
+                            eliminated_masks[i]
+                        )
+                        if mask_bit_counts[candidate_mask] < fewest_possibilities:
+                            fewest_possibilities = mask_bit_counts[candidate_mask]
+                            fewest_possibility_i = i
+                            fewest_possibility_mask = candidate_mask
+                            if fewest_possibilities == 2:
+                                break
+                    if stats is not None:
+                        stats.candidate_time += time.perf_counter() - candidate_start_time
+
+                    if fewest_possibility_i is None:
+                        # totally filled, pause so the solution can be read off the grid
+                        self.search_status = SEARCH_FOUND
+                        return self.search_status
+                    else:
+                        # branch on the position with the fewest possibilities
+                        stack.append([fewest_possibility_i, fewest_possibility_mask, grid.getTrailMark(), 0])
+                elif stats is not None:
+                    stats.candidate_time += time.perf_counter() - candidate_start_time
+
+            # move on to the next untried value of the deepest branch, dropping exhausted branches
+            while stack:
+                frame = stack[-1]
+                grid.undoToTrailMark(frame[2])
+                if frame[1]:
+                    # lowest remaining value
+                    value = (frame[1] & -frame[1]).bit_length() - 1
+                    frame[1] &= ~(1 << value)
+                    frame[3] += 1
+                    grid._setCellValue(frame[0], value)
+                    self.search_has_pending_node = True
+                    break
+                stack.pop()
+                if stats is not None:
+                    stats.addBranchPoint(len(stack), frame[3])
+            if not self.search_has_pending_node:
+                # every branch explored
+                return self._finishSearch()
+
+    def _finishSearch(self):
+        if self.stats is not None:
+            for (depth, frame) in enumerate(self.search_stack):
+                self.stats.addBranchPoint(depth, frame[3])
+        self.search_stack = []
+        self.search_grid = None
+        self.search_has_pending_node = False
+        self.search_status = SEARCH_DONE
+        return self.search_status
+
+
+class SudokuDLXSolver:
+    # exact cover (Algorithm X with dancing links) solver, same interface as SudokuSolver
+    # columns (1-324 for a 9x9 grid): cell filled, row has value, col has value, subgrid has value
+    # each matrix row (729 for a 9x9 grid) places one value (1-9) in one cell (0-80)
+    # link structure templates by box size
+    _templates = {}
+
+    def __init__(self, collect_stats = False, node_budget = None):
         self.found_solutions = []
+        # forced singles here are constraint columns left with a single option
+        self.stats = SudokuSolverStats() if collect_stats else None
+        # max search nodes for each check/count call, None for no limit (an exhausted search can not be resumed)
+        self.node_budget = node_budget
+        self.search_status = SEARCH_DONE
+        self.num_nodes = 0
+
+    def getStats(self):
+        return self.stats
+
+    def checkHasSingleSolution(self, base_grid):
         self.findSolutions(base_grid)
-        return (len(self.found_solutions) == 1)
+        return (self.search_status == SEARCH_DONE and len(self.found_solutions) == 1)
+
+    def checkHasAnySolution(self, base_grid):
+        self.found_solutions = list(self.iterSolutions(base_grid, 1))
+        return len(self.found_solutions) > 0
 
     def getSolutionGrid(self):
         if len(self.found_solutions) == 1:
@@ -22,182 +597,701 @@ class SudokuSolver:
 
     def getAllSolutionCount(self, base_grid):
         self.found_solutions = []
-        self.findSolutions(base_grid, True)
-        return len(self.found_solutions)
+        return self.countSolutions(base_grid)
+
+    def findSolutions(self, base_grid, find_all_solutions = False):
+        self.found_solutions = list(self.iterSolutions(base_grid, None if find_all_solutions else 2))
+        return self.search_status
+
+    def iterSolutions(self, base_grid, limit = None):
+        # yields each solution grid as it is found, at most limit of them
+        for selected_rows in self._iterSelectedRows(base_grid, limit):
+            if self.stats is not None:
+                self.stats.copies_made += 1
+            grid = base_grid.getCopy()
+            grid_size = grid.shape.size
+            for matrix_row in selected_rows:
+                grid._setCellValue(matrix_row // grid_size, matrix_row % grid_size + 1)
+            yield grid
+
+    def countSolutions(self, base_grid, limit = None):
+        # number of solutions (up to limit) without building any solution grids
+        num_solutions = 0
+        for selected_rows in self._iterSelectedRows(base_grid, limit):
+            num_solutions += 1
+        return num_solutions
+
+    def _iterSelectedRows(self, base_grid, limit):
+        # yields the selected matrix rows of each solution, the list changes as soon as the next one is asked for
+        if limit is not None and limit <= 0:
+            return
+        num_solutions = 0
+        for selected_rows in self._startSearch(base_grid):
+            yield selected_rows
+            num_solutions += 1
+            if limit is not None and num_solutions >= limit:
+                # enough solutions found, links are left as is (never reused)
+                return
+
+    def _startSearch(self, base_grid):
+        (left, right, up, down, column, size, node_row, row_first_node) = [
+            list(links) for links in SudokuDLXSolver._getTemplate(base_grid.shape)
+        ]
+        grid_size = base_grid.shape.size
+        self.left = left
+        self.right = right
+        self.up = up
+        self.down = down
+        self.column = column
+        self.size = size
+        self.node_row = node_row
+        self.search_status = SEARCH_DONE
+        self.num_nodes = 0
+
+        # select the matrix rows for every given value up front
+        covered_columns = set()
+        for (i, value) in enumerate(base_grid.cells):
+            if value:
+                first_node = row_first_node[i * grid_size + value - 1]
+                node = first_node
+                while True:
+                    if column[node] in covered_columns:
+                        # given value conflicts with another given value, no solution
+                        return iter(())
+                    covered_columns.add(column[node])
+                    self._cover(column[node])
+                    node = right[node]
+                    if node == first_node:
+                        break
 
-    def findSolutions(self, base_grid, find_all_solutions = False, depth = 0):
-        padding_prefix = ('|   ' * (depth))
-        # print(padding_prefix + 'findSolutions()')
-        padding_prefix = ('|   ' * (depth + 1))
+        if self.stats is not None:
+            self.stats.copies_made += 1
+        return self._search([])
+
+    def _search(self, selected_rows):
+        # generator yielding selected_rows at each solution
+        right = self.right
+        down = self.down
+        size = self.size
+        stats = self.stats
+        if self.node_budget is not None and self.num_nodes >= self.node_budget:
+            # out of budget, stop the whole search
+            self.search_status = SEARCH_PAUSED
+            return
+        self.num_nodes += 1
+        if stats is not None:
+            stats.nodes_visited += 1
+            if len(selected_rows) > stats.max_depth:
+                stats.max_depth = len(selected_rows)
+        if right[0] == 0:
+            # every constraint satisfied, totally filled
+            yield selected_rows
+            return
 
-        if not find_all_solutions and len(self.found_solutions) > 1:
-            # more than one solution, can stop testing
-            return False
+        # choose the constraint column with the fewest remaining options
+        if stats is not None:
+            candidate_start_time = time.perf_counter()
+        best_column = right[0]
+        fewest_options = size[best_column]
+        col = right[best_column]
+        while col != 0 and fewest_options > 1:
+            if size[col] < fewest_options:
+                best_column = col
+                fewest_options = size[col]
+            col = right[col]
+        if stats is not None:
+            stats.candidate_time += time.perf_counter() - candidate_start_time
+            if fewest_options == 1:
+                stats.forced_singles += 1
+
+        if fewest_options == 0:
+            # dead end
+            return
 
-        grid = base_grid.getCopy()
-
-        # fill out all single solution positions
-        num_replaced = None
-        fewest_possibility_xy = None
-        while num_replaced is not 0:
-            # each time we replace, try all remaining empty positions again
-            num_replaced = 0
-            fewest_possibilities = 10
-            for (x, y) in grid.findValueAllXY(None):
-                eligible_values = grid.getXYEligibleValues(x, y)
-                num_eligible_values = len(eligible_values)
-                if num_eligible_values == 0:
-                    # no solution
-                    # print(padding_prefix + '>> None :1: no solution <<')
-                    return
-                elif num_eligible_values == 1:
-                    # only one potential value, go ahead and set it
-                    grid.setXYValue(x, y, eligible_values[0])
-                    if fewest_possibilities > 0:
-                        fewest_possibilities = 0
-                        fewest_possibility_xy = None
-                    num_replaced += 1
-                elif num_eligible_values < fewest_possibilities:
-                    fewest_possibilities = num_eligible_values
-                    fewest_possibility_xy = [x, y]
-
-        if fewest_possibility_xy is None:
-            # totally filled, good to go
-            self.found_solutions.append(grid)
-            # print(padding_prefix + '>> True :2: totally filled, good! <<')
+        self._cover(best_column)
+        num_values_tried = 0
+        row_node = down[best_column]
+        while row_node != best_column:
+            num_values_tried += 1
+            selected_rows.append(self.node_row[row_node])
+            node = right[row_node]
+            while node != row_node:
+                self._cover(self.column[node])
+                node = right[node]
+
+            for solution_rows in self._search(selected_rows):
+                yield solution_rows
+
+            node = self.left[row_node]
+            while node != row_node:
+                self._uncover(self.column[node])
+                node = self.left[node]
+            selected_rows.pop()
+
+            if self.search_status != SEARCH_DONE:
+                # out of budget, can exit now (links left as is, never reused)
+                break
+            row_node = down[row_node]
         else:
-            # process just the first multi-solution position in this pass
-            num_pass = 0
-            num_fail = 0
-            (x, y) = fewest_possibility_xy
-
-            # print(padding_prefix + '@@ check eligible values', grid.getXYEligibleValues(x, y), '@@')
-            for eligible_value in grid.getXYEligibleValues(x, y):
-                # attempt a recursive check assuming this value
-                grid.setXYValue(x, y, eligible_value)
-                self.findSolutions(grid, find_all_solutions, depth + 1)
-                if not find_all_solutions and len(self.found_solutions) > 1:
-                    # multiple solutions found, can exit now
+            self._uncover(best_column)
+        if stats is not None and fewest_options > 1:
+            stats.addBranchPoint(len(selected_rows), num_values_tried)
+
+    def _cover(self, col):
+        left = self.left
+        right = self.right
+        up = self.up
+        down = self.down
+        column = self.column
+        size = self.size
+        right[left[col]] = right[col]
+        left[right[col]] = left[col]
+        row_node = down[col]
+        while row_node != col:
+            node = right[row_node]
+            while node != row_node:
+                down[up[node]] = down[node]
+                up[down[node]] = up[node]
+                size[column[node]] -= 1
+                node = right[node]
+            row_node = down[row_node]
+
+    def _uncover(self, col):
+        left = self.left
+        right = self.right
+        up = self.up
+        down = self.down
+        column = self.column
+        size = self.size
+        row_node = up[col]
+        while row_node != col:
+            node = left[row_node]
+            while node != row_node:
+                size[column[node]] += 1
+                down[up[node]] = node
+                up[down[node]] = node
+                node = left[node]
+            row_node = up[row_node]
+        right[left[col]] = col
+        left[right[col]] = col
+
+    @staticmethod
+    def _getTemplate(shape):
+        # build the full link structure once per grid shape (729 x 324 for a 9x9 grid), each solve works on a
+        #   copy of it
+        if shape.box_size not in SudokuDLXSolver._templates:
+            grid_size = shape.size
+            num_cells = shape.num_cells
+            num_columns = num_cells * 4
+            # node 0 is the root, nodes 1 to num_columns are the column headers
+            left = [i - 1 for i in range(num_columns + 1)]
+            left[0] = num_columns
+            right = [i + 1 for i in range(num_columns + 1)]
+            right[num_columns] = 0
+            up = list(range(num_columns + 1))
+            down = list(range(num_columns + 1))
+            column = list(range(num_columns + 1))
+            size = [0] * (num_columns + 1)
+            node_row = [None] * (num_columns + 1)
+            row_first_node = []
+
+            for matrix_row in range(num_cells * grid_size):
+                i = matrix_row // grid_size
+                value_index = matrix_row % grid_size
+                row_columns = [
+                    1 + i,
+                    1 + num_cells + shape.cell_row[i] * grid_size + value_index,
+                    1 + num_cells * 2 + shape.cell_col[i] * grid_size + value_index,
+                    1 + num_cells * 3 + shape.cell_subgrid[i] * grid_size + value_index,
+                ]
+                first_node = len(column)
+                row_first_node.append(first_node)
+                for (j, col) in enumerate(row_columns):
+                    node = first_node + j
+                    # link horizontally in a circular list of the row's 4 nodes
+                    left.append(first_node + (j - 1) % 4)
+                    right.append(first_node + (j + 1) % 4)
+                    # append to the bottom of the column
+                    up.append(up[col])
+                    down.append(col)
+                    down[up[col]] = node
+                    up[col] = node
+                    column.append(col)
+                    node_row.append(matrix_row)
+                    size[col] += 1
+
+            SudokuDLXSolver._templates[shape.box_size] = (
+                left, right, up, down, column, size, node_row, row_first_node
+            )
+        return SudokuDLXSolver._templates[shape.box_size]
+
+
+def getUnavoidableRectangles(solved_grid):
+    # deadly rectangles of a solved grid: 2 rows x 2 cols across exactly 2 subgrids holding a, b / b, a, swapping
+    #   the values gives another solution so a puzzle must keep at least one of the 4 positions visible
+    # returns lists of cell indexes
+    shape = solved_grid.shape
+    (size, box_size) = (shape.size, shape.box_size)
+    rows = [solved_grid.cells[row * size:row * size + size] for row in range(size)]
+    rectangles = []
+    for row_1 in range(size):
+        for row_2 in range(row_1 + 1, size):
+            is_same_band = row_1 // box_size == row_2 // box_size
+            # col of each value in the second row
+            value_cols = [0] * (size + 1)
+            for (col, value) in enumerate(rows[row_2]):
+                value_cols[value] = col
+            for col_1 in range(size):
+                col_2 = value_cols[rows[row_1][col_1]]
+                # col_2 holds row_1's value in row_2, it needs row_2's value in row_1 (each pair seen once)
+                if col_2 <= col_1 or rows[row_1][col_2] != rows[row_2][col_1]:
+                    continue
+                if is_same_band == (col_1 // box_size == col_2 // box_size):
+                    # within one subgrid (impossible) or across 4 subgrids (not swappable)
+                    continue
+                rectangles.append([
+                    row_1 * size + col_1, row_1 * size + col_2, row_2 * size + col_1, row_2 * size + col_2
+                ])
+    return rectangles
+
+
+# clue symmetries by name, each maps x, y to the positions that must be hidden or shown along with it
+CLUE_SYMMETRIES = {
+    # 180 degree rotation
+    'rotational': lambda x, y, last: [(x, y), (last - x, last - y)],
+    # left-right mirror
+    'mirror': lambda x, y, last: [(x, y), (last - x, y)],
+    # main diagonal mirror
+    'diagonal': lambda x, y, last: [(x, y), (y, x)],
+    # 90 degree rotation
+    'quad': lambda x, y, last: [(x, y), (last - y, x), (last - x, last - y), (y, last - x)],
+}
+
+
+def getSymmetryOrbits(shape, symmetry):
+    # every position grouped into tuples of the positions the symmetry maps it to, each listed once
+    orbits = set()
+    for y in range(shape.size):
+        for x in range(shape.size):
+            orbits.add(tuple(sorted(set(CLUE_SYMMETRIES[symmetry](x, y, shape.size - 1)))))
+    return sorted(orbits)
+
+
+class SudokuUniquenessChecker:
+    # answers "does the puzzle still have a single solution" for a puzzle grid that is built up by hiding
+    #   values of a known solved grid one at a time
+    # if the puzzle had a single solution (the solved grid) before hiding x, y then any other solution must
+    #   use a different value at x, y, so only those values need to be searched, stopping at the first
+    #   solution found
+    # removals are screened against unavoidable sets first: groups of positions that can not all be hidden,
+    #   since their values can be swapped for another solution (the deadly rectangles of the solved grid, plus
+    #   the positions every other solution found by a check differs in), hiding the last visible position of
+    #   one fails without searching
+    # with a node_budget the checks stop searching once that many search nodes have been visited in total, a
+    #   check cut short is answered False (the removal can not be verified) and is_out_of_budget is set
+    def __init__(self, solved_grid, collect_stats = False, propagator = None, result_cache = None,
+                 node_budget = None):
+        self.solved_grid = solved_grid
+        # puzzle grid kept in sync by the caller, its value masks are reused across every check
+        self.puzzle_grid = solved_grid.getCopy()
+        # same search as the backtracking solver, the searches here are small enough that the cheaper
+        #   singles only pipeline beats the full one
+        if propagator is None:
+            propagator = SudokuPropagator(('hidden_singles',))
+        self.solver = SudokuSolver(collect_stats, propagator=propagator, result_cache=result_cache)
+        # unavoidable sets (lists of cell indexes) containing each position
+        self.unavoidable_sets = [[] for i in range(solved_grid.shape.num_cells)]
+        for cell_set in getUnavoidableRectangles(solved_grid):
+            self._addUnavoidableSet(cell_set)
+        # checks answered by the unavoidable sets, positions found forced without a search, and searches made
+        self.num_screened = 0
+        self.num_forced = 0
+        self.num_searched = 0
+        self.node_budget = node_budget
+        self.is_out_of_budget = False
+
+    def getStats(self):
+        return self.solver.getStats()
+
+    def getNumNodes(self):
+        # search nodes visited over every check
+        return self.solver.total_num_nodes
+
+    def getUnavoidableSetCount(self, x, y):
+        return len(self.unavoidable_sets[y * self.puzzle_grid.shape.size + x])
+
+    def checkHiddenXYKeepsSingleSolution(self, x, y):
+        return self.checkHiddenXYsKeepSingleSolution([(x, y)])
+
+    def checkHiddenXYsKeepSingleSolution(self, hidden_xys):
+        # the positions have all been hidden in the puzzle grid, which had a single solution before
+        grid = self.puzzle_grid
+        cells = grid.cells
+        size = grid.shape.size
+        hidden_cells = [y * size + x for (x, y) in hidden_xys]
+        for i in hidden_cells:
+            for cell_set in self.unavoidable_sets[i]:
+                if not any(cells[j] for j in cell_set):
+                    self.num_screened += 1
+                    return False
+
+        solved_cells = self.solved_grid.cells
+        trail_mark = grid.getTrailMark()
+        has_other_solution = False
+        for i in hidden_cells:
+            solved_value = solved_cells[i]
+            if self._checkIsHiddenSingle(i, solved_value):
+                # no other position in a row, col, or subgrid can take the value, so every solution has it here
+                self.num_forced += 1
+                grid._setCellValue(i, solved_value)
+                continue
+            for value in grid.shape.mask_values[grid.getXYEligibleMask(i % size, i // size) & ~(1 << solved_value)]:
+                value_trail_mark = grid.getTrailMark()
+                grid._setCellValue(i, value)
+                self.num_searched += 1
+                if self.node_budget is not None:
+                    self.solver.node_budget = max(0, self.node_budget - self.solver.total_num_nodes)
+                for solution_grid in self.solver.iterSolutions(grid, 1):
+                    # the positions this solution changes can never all be hidden
+                    solution_cells = solution_grid.cells
+                    self._addUnavoidableSet([
+                        j for j in range(len(solution_cells)) if solution_cells[j] != solved_cells[j]
+                    ])
+                    has_other_solution = True
+                grid.undoToTrailMark(value_trail_mark)
+                if not has_other_solution and self.solver.search_status != SEARCH_DONE:
+                    # out of nodes before ruling another solution out
+                    self.is_out_of_budget = True
+                    grid.undoToTrailMark(trail_mark)
+                    return False
+                if has_other_solution:
+                    break
+            if has_other_solution:
+                break
+            # any other solution left must differ at a later position, search those with this one solved
+            grid._setCellValue(i, solved_value)
+        grid.undoToTrailMark(trail_mark)
+        return not has_other_solution
+
+    def getForcedVisibleXYs(self, hidden_xys):
+        # positions that must stay visible since hiding hidden_xys left them the last visible position of an
+        #   unavoidable set, found in bulk from the sets the hidden positions are in
+        cells = self.puzzle_grid.cells
+        shape = self.puzzle_grid.shape
+        forced_xys = set()
+        for (x, y) in hidden_xys:
+            for cell_set in self.unavoidable_sets[y * shape.size + x]:
+                visible_cells = [j for j in cell_set if cells[j]]
+                if len(visible_cells) == 1:
+                    forced_xys.add((shape.cell_col[visible_cells[0]], shape.cell_row[visible_cells[0]]))
+        return forced_xys
+
+    def _checkIsHiddenSingle(self, i, value):
+        grid = self.puzzle_grid
+        cells = grid.cells
+        value_bit = 1 << value
+        for unit in grid.shape.cell_units[i]:
+            if not any(not cells[j] and grid.getCellCandidateMask(j) & value_bit for j in unit):
+                return True
+        return False
+
+    def _addUnavoidableSet(self, cell_set):
+        for i in cell_set:
+            self.unavoidable_sets[i].append(cell_set)
+
+
+# grading techniques from easiest to hardest with the score added for each placement or elimination they make,
+#   a guess is scored when none of them make progress
+GRADER_TECHNIQUES = (
+    ('hidden_singles', 1),
+    ('naked_singles', 2),
+    ('pointing_pairs', 10),
+    ('naked_pairs', 15),
+)
+GRADER_GUESS_TECHNIQUE = 'guess'
+GRADER_GUESS_SCORE = 100
+
+
+def getMaxGraderScore(box_size = 3):
+    # upper bound on the SudokuGrader score of any puzzle of the box size: a single solution needs clues of all
+    #   but one value, every other position is placed once (by a guess at most) and has each of its candidates
+    #   but one eliminated at most once
+    size = box_size * box_size
+    placement_score = max([GRADER_GUESS_SCORE] + [score for (technique, score) in GRADER_TECHNIQUES])
+    elimination_score = max(score for (technique, score) in GRADER_TECHNIQUES)
+    return (size * size - (size - 1)) * (placement_score + (size - 1) * elimination_score)
+
+
+class SudokuGrader:
+    # rates a puzzle by solving it the way a person would: always using the easiest technique that makes
+    #   progress, falling back to a guess (filled in from the solution) only when every technique is stuck
+    def __init__(self):
+        self.propagator = SudokuPropagator()
+        self.technique_functions = [
+            (technique, self.propagator.getTechniqueFunction(technique), score)
+            for (technique, score) in GRADER_TECHNIQUES
+        ]
+
+    def grade(self, puzzle_grid, solved_grid = None):
+        # returns (score, hardest technique used), (None, None) if the puzzle has no solution
+        # solved_grid is only needed for guessing, it is searched for when not given
+        grid = puzzle_grid.getCopy()
+        cells = grid.cells
+        score = 0
+        hardest_rank = -1
+        while True:
+            for (rank, (technique, technique_function, technique_score)) in enumerate(self.technique_functions):
+                num_changes = technique_function(grid, None)
+                if num_changes is None:
+                    return (None, None)
+                if num_changes:
+                    score += num_changes * technique_score
+                    hardest_rank = max(hardest_rank, rank)
                     break
+            else:
+                if 0 not in cells:
+                    break
+                if solved_grid is None:
+                    solver = SudokuSolver()
+                    if not solver.checkHasAnySolution(puzzle_grid):
+                        return (None, None)
+                    solved_grid = solver.found_solutions[0]
+                # guess at the empty position with the fewest candidates
+                i = min(
+                    (i for i in range(grid.shape.num_cells) if not cells[i]),
+                    key=lambda i: grid.shape.mask_bit_counts[grid.getCellCandidateMask(i)]
+                )
+                grid._setCellValue(i, solved_grid.cells[i])
+                score += GRADER_GUESS_SCORE
+                hardest_rank = len(self.technique_functions)
+
+        if hardest_rank < 0:
+            hardest_technique = None
+        elif hardest_rank == len(self.technique_functions):
+            hardest_technique = GRADER_GUESS_TECHNIQUE
+        else:
+            hardest_technique = self.technique_functions[hardest_rank][0]
+        return (score, hardest_technique)
+
+
+# solver backends selectable by name
+SOLVER_CLASSES = {
+    'backtrack': SudokuSolver,
+    'dlx': SudokuDLXSolver,
+}
+
+
+def cleanPuzzleString(puzzle_string, box_size = 3):
+    # sanitize, leaving only the value characters and . (empty) positions
+    puzzle_string = str(puzzle_string).strip().upper()
+    allowed_chars = getGridShape(box_size).value_chars + '.'
+    if not puzzle_string.strip(allowed_chars):
+        # already clean, the usual case
+        return puzzle_string
+    return ''.join([char for char in puzzle_string if char in allowed_chars])
 
 
 class SudokuGrid:
-    def __init__(self):
-        # initialize empty 9x9 grid
-        self.grid_matrix = [[None for x in range(9)] for x in range(9)]
+    __slots__ = ('shape', 'cells', 'row_masks', 'col_masks', 'subgrid_masks', 'eliminated_masks', 'trail')
+
+    def __init__(self, box_size = 3):
+        # initialize empty grid (9x9 by default), stored row by row as one flat array (0 means empty)
+        self.shape = shape = getGridShape(box_size)
+        self.cells = bytearray(shape.num_cells)
+        # used value bitmasks for each row, col, and subgrid (subgrids numbered left to right, top to bottom)
+        self.row_masks = [0] * shape.size
+        self.col_masks = [0] * shape.size
+        self.subgrid_masks = [0] * shape.size
+        # per position values ruled out by propagation on top of the row, col, and subgrid masks
+        self.eliminated_masks = [0] * shape.num_cells
+        # list of (cell index, previous value) changes, only recorded once getTrailMark() is called
+        # eliminated mask changes are recorded as (number of cells + cell index, previous eliminated mask)
+        self.trail = None
 
     def seedFromString(self, puzzle_string):
-        # sanitize
-        puzzle_string = str(puzzle_string).strip()
-        puzzle_string = re.sub('[^1-9\.]', '', puzzle_string)
+        shape = self.shape
+        puzzle_string = cleanPuzzleString(puzzle_string, shape.box_size)
         # all digits must be specified
-        if len(puzzle_string) == 81:
-            x = 0
-            y = 0
+        if len(puzzle_string) == shape.num_cells:
             for (i, digit) in enumerate(puzzle_string):
                 # clean up digit
                 if digit == '.':
-                    digit = None
+                    digit = 0
                 else:
-                    digit = int(digit)
-                self.setXYValue(x, y, digit)
-                x += 1
-                if (x % 9) == 0:
-                    # starting new row
-                    x = 0
-                    y += 1
+                    digit = shape.value_chars.index(digit) + 1
+                self._setCellValue(i, digit)
             return True
         else:
             return False
 
+    def seedFromValues(self, values):
+        # values listed row by row, 0 or None for empty positions
+        for (i, value) in enumerate(values):
+            self._setCellValue(i, value or 0)
+        return self
+
+    def seedFromCells(self, cells):
+        # values listed row by row as bytes (0 for empty positions, e.g. unpacked from a packed record) copied in
+        #   one step onto an empty grid, only the masks are worked out position by position
+        shape = self.shape
+        if len(cells) != shape.num_cells or max(cells) > shape.size:
+            raise ValueError('Not a %dx%d grid' % (shape.size, shape.size))
+        self.cells[:] = cells
+        (cell_row, cell_col, cell_subgrid) = (shape.cell_row, shape.cell_col, shape.cell_subgrid)
+        (row_masks, col_masks, subgrid_masks) = (self.row_masks, self.col_masks, self.subgrid_masks)
+        for (i, value) in enumerate(self.cells):
+            if value:
+                bit = 1 << value
+                row_masks[cell_row[i]] |= bit
+                col_masks[cell_col[i]] |= bit
+                subgrid_masks[cell_subgrid[i]] |= bit
+        return self
+
     def getCopy(self):
-        copy = SudokuGrid()
-        # ensure the copy grid is not using same pointers as original
-        copy.grid_matrix = [list(row) for row in self.grid_matrix]
+        copy = SudokuGrid(self.shape.box_size)
+        # ensure the copy grid is not using same pointers as original (the trail is not copied)
+        copy.cells[:] = self.cells
+        copy.row_masks[:] = self.row_masks
+        copy.col_masks[:] = self.col_masks
+        copy.subgrid_masks[:] = self.subgrid_masks
+        copy.eliminated_masks[:] = self.eliminated_masks
         return copy
 
+    def getTrailMark(self):
+        # start recording changes if not already, the mark can later be passed to undoToTrailMark
+        if self.trail is None:
+            self.trail = []
+        return len(self.trail)
+
+    def undoToTrailMark(self, trail_mark):
+        trail = self.trail
+        num_cells = self.shape.num_cells
+        while len(trail) > trail_mark:
+            (i, old_value) = trail.pop()
+            if i < num_cells:
+                self._applyCellValue(i, old_value)
+            else:
+                self.eliminated_masks[i - num_cells] = old_value
+        return self
+
     def resetSubGrid(self, subgrid_x, subgrid_y):
-        min_x = subgrid_x * 3
-        min_y = subgrid_y * 3
-        # reset 3x3 subgrid at macro position subgrid_x, subgrid_y
-        for (x, y) in [(x, y) for x in range(3) for y in range(3)]:
-            x += min_x
-            y += min_y
-            self.grid_matrix[y][x] = None
+        # reset subgrid at macro position subgrid_x, subgrid_y
+        for i in self.shape.subgrid_cells[subgrid_y * self.shape.box_size + subgrid_x]:
+            self._setCellValue(i, 0)
         return self
 
     def setXYValue(self, x, y, new_value):
-        self.grid_matrix[y][x] = new_value
+        self._setCellValue(y * self.shape.size + x, new_value or 0)
         return self
 
+    def _setCellValue(self, i, new_value):
+        old_value = self.cells[i]
+        if old_value != new_value:
+            if self.trail is not None:
+                self.trail.append((i, old_value))
+            self._applyCellValue(i, new_value)
+
+    def _eliminateCellValues(self, i, values_mask):
+        # rule out values at position i, returns True if any were still candidates
+        old_mask = self.eliminated_masks[i]
+        new_mask = old_mask | values_mask
+        if new_mask == old_mask:
+            return False
+        if self.trail is not None:
+            self.trail.append((self.shape.num_cells + i, old_mask))
+        self.eliminated_masks[i] = new_mask
+        return True
+
+    def getCellCandidateMask(self, i):
+        # values still possible at position i (by cell index)
+        shape = self.shape
+        return shape.all_values_mask & ~(
+            self.row_masks[shape.cell_row[i]] |
+            self.col_masks[shape.cell_col[i]] |
+            self.subgrid_masks[shape.cell_subgrid[i]] |
+            self.eliminated_masks[i]
+        )
+
+    def _applyCellValue(self, i, new_value):
+        shape = self.shape
+        old_value = self.cells[i]
+        row_num = shape.cell_row[i]
+        col_num = shape.cell_col[i]
+        subgrid_num = shape.cell_subgrid[i]
+        if old_value:
+            # release the old value from the row, col, and subgrid masks
+            clear_mask = ~(1 << old_value)
+            self.row_masks[row_num] &= clear_mask
+            self.col_masks[col_num] &= clear_mask
+            self.subgrid_masks[subgrid_num] &= clear_mask
+        if new_value:
+            bit = 1 << new_value
+            self.row_masks[row_num] |= bit
+            self.col_masks[col_num] |= bit
+            self.subgrid_masks[subgrid_num] |= bit
+        self.cells[i] = new_value
+
     def setSubgridValues(self, subgrid_x, subgrid_y, new_values):
-        min_x = subgrid_x * 3
-        min_y = subgrid_y * 3
-        for (x, y) in [(x, y) for x in range(3) for y in range(3)]:
+        box_size = self.shape.box_size
+        min_x = subgrid_x * box_size
+        min_y = subgrid_y * box_size
+        for (x, y) in [(x, y) for x in range(box_size) for y in range(box_size)]:
             x += min_x
             y += min_y
             new_value = new_values.pop()
-            self.grid_matrix[y][x] = new_value
+            self.setXYValue(x, y, new_value)
         return self
 
     def getXYValue(self, x, y):
-        return self.grid_matrix[y][x]
+        return self.cells[y * self.shape.size + x] or None
 
     def getRowUsedValues(self, row_num):
-        return self.grid_matrix[row_num]
+        size = self.shape.size
+        return [value or None for value in self.cells[row_num * size:row_num * size + size]]
 
     def getColUsedValues(self, col_num):
-        return [row[col_num] for row in self.grid_matrix]
+        return [value or None for value in self.cells[col_num::self.shape.size]]
 
     def getXYSelfSubGridUsedValues(self, x, y):
-        subgrid_x = int(math.floor(x / 3))
-        subgrid_y = int(math.floor(y / 3))
+        subgrid_x = x // self.shape.box_size
+        subgrid_y = y // self.shape.box_size
         return self.getSubGridUsedValues(subgrid_x, subgrid_y)
 
+    def getXYEligibleMask(self, x, y):
+        # row, col, and subgrid masks are kept up to date by setXYValue
+        shape = self.shape
+        i = y * shape.size + x
+        used_mask = self.row_masks[y] | self.col_masks[x] | self.subgrid_masks[shape.cell_subgrid[i]]
+        return shape.all_values_mask & ~(used_mask | self.eliminated_masks[i])
+
     def getXYEligibleValues(self, x, y):
-        # TODO: [TN 3/6/16] instead of recalculating this every time accessed have a way to store it
-        #   and update when necessary
-        exclude_numbers = set(
-            self.getRowUsedValues(y) +
-            self.getColUsedValues(x) +
-            self.getXYSelfSubGridUsedValues(x, y)
-        )
-        values = list(set([1, 2, 3, 4, 5, 6, 7, 8, 9]) - exclude_numbers)
-        return values
+        # returns a fresh list so callers are free to shuffle/modify it
+        return list(self.shape.mask_values[self.getXYEligibleMask(x, y)])
 
     def getSubGridUsedValues(self, subgrid_x, subgrid_y):
-        values = []
-        min_x = subgrid_x * 3
-        min_y = subgrid_y * 3
-        for (x, y) in [(x, y) for x in range(3) for y in range(3)]:
-            x += min_x
-            y += min_y
-            values.append(self.grid_matrix[y][x])
-        return values
+        return [
+            self.cells[i] or None
+            for i in self.shape.subgrid_cells[subgrid_y * self.shape.box_size + subgrid_x]
+        ]
 
     def findSubGridValueXY(self, subgrid_x, subgrid_y, value):
-        min_x = subgrid_x * 3
-        min_y = subgrid_y * 3
-        for (x, y) in [(x, y) for x in range(3) for y in range(3)]:
-            x += min_x
-            y += min_y
-            if self.grid_matrix[y][x] == value:
-                return [x, y]
+        shape = self.shape
+        for i in shape.subgrid_cells[subgrid_y * shape.box_size + subgrid_x]:
+            if self.cells[i] == (value or 0):
+                return [shape.cell_col[i], shape.cell_row[i]]
         return None
 
     def findValueAllXY(self, value):
-        found_xy = []
-        for (x, y) in [(x, y) for x in range(9) for y in range(9)]:
-            if self.grid_matrix[y][x] == value:
-                found_xy.append([x, y])
-        return found_xy
+        value = value or 0
+        cells = self.cells
+        shape = self.shape
+        return [[shape.cell_col[i], shape.cell_row[i]] for i in shape.column_order_cells if cells[i] == value]
 
     def findNotValueAllXY(self, value):
-        not_found_xy = []
-        for (x, y) in [(x, y) for x in range(9) for y in range(9)]:
-            if self.grid_matrix[y][x] != value:
-                not_found_xy.append([x, y])
-        return not_found_xy
+        value = value or 0
+        cells = self.cells
+        shape = self.shape
+        return [[shape.cell_col[i], shape.cell_row[i]] for i in shape.column_order_cells if cells[i] != value]
 
     def _formatGridDisplayValue(self, value):
         if value == None:
@@ -206,233 +1300,491 @@ class SudokuGrid:
             value = 'T'
         elif value == False and str(value) == 'False':
             value = 'F'
+        elif isinstance(value, int):
+            value = self.shape.value_chars[value - 1]
         else:
             value = str(value)
         return value
 
     def displayGrid(self, is_pretty_output = True):
-        output = ''
+        print(self.getDisplayString(is_pretty_output))
+
+    def getDisplayString(self, is_pretty_output = True):
+        box_size = self.shape.box_size
+        size = self.shape.size
 
         if is_pretty_output:
-            horiz_spacer_row = "-------+-------+-------\n"
-            for (i, row) in enumerate(self.grid_matrix):
-                output += ' '
-                for (j, value) in enumerate(row):
-                    value = self._formatGridDisplayValue(value)
-                    output += value + ' '
-                    if ((j + 1) % 3 == 0 and j < 8):
-                        output += '| '
-                output += "\n"
-                if ((i + 1) % 3 == 0 and i < 8):
-                    output += horiz_spacer_row
-        else:
-            output = ''.join(
-                [''.join(
-                    self._formatGridDisplayValue(value) for value in row
-                ) for row in self.grid_matrix]
+            # rows of box_size subgrid slices, joined once rather than added up piece by piece
+            horiz_spacer_row = '+'.join(['-' * (box_size * 2 + 1)] * box_size) + "\n"
+            row_strings = []
+            for i in range(size):
+                values = [self._formatGridDisplayValue(value) for value in self.getRowUsedValues(i)]
+                row_strings.append(' ' + '| '.join(
+                    ''.join(value + ' ' for value in values[j:j + box_size]) for j in range(0, size, box_size)
+                ) + "\n")
+            return horiz_spacer_row.join(
+                ''.join(row_strings[i:i + box_size]) for i in range(0, size, box_size)
             )
+        return ''.join(
+            self._formatGridDisplayValue(value or None) for value in self.cells
+        )
 
-        print(output)
+    def checkIsConsistent(self):
+        # verify no value is repeated within any row, col, or subgrid (empty positions allowed)
+        # each filled position sets one bit in each mask, so any repeat leaves the masks short of bits
+        num_filled = self.shape.num_cells - self.cells.count(0)
+        mask_bit_counts = self.shape.mask_bit_counts
+        for masks in (self.row_masks, self.col_masks, self.subgrid_masks):
+            if sum(mask_bit_counts[mask] for mask in masks) != num_filled:
+                return False
+        return True
 
     def test(self):
         # verify if valid grid
-        # check each row complete
-        for row_num in range(9):
-            values = list(set(self.getRowUsedValues(row_num) + [None]))
-            values.remove(None)
-            if len(values) != 9:
-                return False
-        # check each col complete
-        for col_num in range(9):
-            values = list(set(self.getColUsedValues(col_num) + [None]))
-            values.remove(None)
-            if len(values) != 9:
-                return False
-        # check each subgrid complete
-        for (subgrid_x, subgrid_y) in [(x, y) for x in range(3) for y in range(3)]:
-            values = list(set(self.getSubGridUsedValues(subgrid_x, subgrid_y) + [None]))
-            values.remove(None)
-            if len(values) != 9:
-                return False
+        # every row, col, and subgrid complete means all cells filled with no repeats in any mask
+        if 0 in self.cells:
+            return False
+        for masks in (self.row_masks, self.col_masks, self.subgrid_masks):
+            for mask in masks:
+                if mask != self.shape.all_values_mask:
+                    return False
         return True
 
 
 class SudokuPuzzle:
-    population_pattern_order_all = [
-        # no internal conflict passes
-        [0, 0],
-        [1, 1],
-        [2, 2],
-        # one internal conflict passes
-        [0, 2],
-        [2, 0],
-        # two internal conflict passes
-        [0, 1],
-        [1, 0],
-        # three internal conflict passes (final)
-        [1, 2],
-        [2, 1],
-    ]
-    population_pattern_order_no_conflicts = [
-        # no internal conflict passes
-        [0, 0],
-        [1, 1],
-        [2, 2],
-    ]
-    population_pattern_order_with_conflicts = [
-        # one internal conflict passes
-        [0, 2],
-        [2, 0],
-        # two internal conflict passes
-        [0, 1],
-        [1, 0],
-        # three internal conflict passes (final)
-        [1, 2],
-        [2, 1],
-    ]
-
-    def __init__(self):
+    # rollbacks to an earlier checkpoint allowed in one hiding attempt before starting over, and attempts
+    #   before giving up on the solved grid
+    max_hide_rollbacks = 10
+    max_hide_attempts = 10
+    # solved grids tried by generators that start over with a new one on GENERATE_GAVE_UP, before giving up
+    max_solved_grid_attempts = 10
+    # values tried per grid position while seeding a solved grid before starting over
+    max_seed_attempts = 10
+    # visible clue counts for difficulties [1, 2, 3, 4, 5] by box size, bigger grids keep proportionally more
+    #   clues since proving a sparse 16x16 or 25x25 puzzle unique quickly gets out of hand
+    difficulty_visible_counts = {
+        2: [7, 6, 6, 5, 5],
+        3: [32, 30, 28, 27, 26],
+        4: [118, 114, 110, 107, 104],
+        5: [370, 360, 350, 340, 330],
+    }
+
+    def __init__(self, solver_name = 'backtrack', seed = None, grid_pool = None, collect_stats = False,
+                 box_size = 3, result_cache = None, time_budget = None, node_budget = None):
         self.start_time = time.time()
+        # grids are box_size ** 2 positions square (9x9 by default)
+        self.box_size = box_size
+        self.shape = getGridShape(box_size)
+        # name of the SOLVER_CLASSES backend used to verify hidden number grids
+        self.solver_name = solver_name
+        # private random stream, the same seed always generates the same puzzle
+        if isinstance(seed, random.Random):
+            self.random = seed
+        else:
+            self.random = random.Random(seed)
+        # optional sudokutransform.SudokuGridPool to draw transformed solved grids from (9x9 grids only)
+        if grid_pool is not None and box_size != 3:
+            raise ValueError('Solved grid pools only hold 9x9 grids')
+        self.grid_pool = grid_pool
+        # optional sudokucache.SudokuResultCache for the uniqueness checks, can be shared between puzzles
+        self.result_cache = result_cache
+        # generation budget, seconds since start_time and nodes (values tried while seeding the solved grid plus
+        #   uniqueness check search nodes), None for no limit, see getStatus for how it ran out
+        self.time_budget = time_budget
+        self.node_budget = node_budget
+        self.num_nodes = 0
+        self.status = GENERATE_PENDING
+        # seconds spent in each generation stage, for latency breakdowns
+        self.stage_times = {}
+        # hidden numbers grid with the fewest clues left by a discarded hiding attempt, the fallback once the
+        #   budget runs out
+        self.best_hidden_numbers_grid = None
+        # search counters of the uniqueness checks and final solver check made while hiding numbers
+        self.collect_stats = collect_stats
+        self.solver_stats = {}
         self.seed_random_attempts = 0
+        self.seed_attempt_budget = None
         self.generate_hidden_numbers_attempts = 0
+        self.hide_stats = {}
         self.solved_grid = None
         self.final_hidden_numbers_grid = None
+        self.final_grade = None
         self._seedRandomSolvedGrid()
 
     def getSolvedGrid(self):
         return self.solved_grid
 
-    def getHiddenNumbersGrid(self, difficulty = 1):
+    def getHideStats(self):
+        # removal counters of the last getHiddenNumbersGrid call, including the work thrown away by rollbacks
+        return self.hide_stats
+
+    def getSolverStats(self):
+        # stats dicts by hiding stage, empty unless created with collect_stats=True
+        return self.solver_stats
+
+    def getStatus(self):
+        # one of the GENERATE_ states
+        return self.status
+
+    def getClueCount(self):
+        # visible positions of the hidden numbers grid, None until it is generated
+        if self.final_hidden_numbers_grid is None:
+            return None
+        return self.shape.num_cells - self.final_hidden_numbers_grid.cells.count(0)
+
+    def getStageTimes(self):
+        # seconds spent seeding the solved grid ('seed'), hiding numbers ('hide', discarded attempts included),
+        #   double checking the final grid ('verify'), and grading it ('grade', once getGrade is called)
+        return self.stage_times
+
+    def getGrade(self):
+        # SudokuGrader (score, hardest technique) of the hidden numbers grid, None until it is generated
+        if self.final_hidden_numbers_grid is None:
+            return None
+        if self.final_grade is None:
+            stage_start_time = time.perf_counter()
+            self.final_grade = SudokuGrader().grade(self.final_hidden_numbers_grid, self.solved_grid)
+            self._addStageTime('grade', stage_start_time)
+        return self.final_grade
+
+    def getHiddenNumbersGrid(self, difficulty = 1, score_band = None, symmetry = None, is_minimal = False):
         # puzzle criteria
         # - must have one solution
         # - at least 8 of the numbers 1 - 9 need to be present
         # - avg # of clues around 27, never lower than 17 and never more than 32
+        # with a (min score, max score) score_band numbers are hidden until the SudokuGrader score lands in the
+        #   band instead of until the difficulty's clue count is reached, removals that would overshoot the
+        #   band are undone, the difficulty still sets how many of each number are hidden up front
+        # with a CLUE_SYMMETRIES symmetry the visible positions keep that symmetry, they are hidden a whole orbit
+        #   (pair or quad of positions) at a time
+        # is_minimal keeps hiding until no visible position (or orbit) can be hidden, ignoring the clue count
+        #   and score band
+        # returns None if no puzzle meeting the criteria was found within max_hide_attempts attempts
+        # once the time or node budget runs out the valid puzzle with the fewest clues found so far is returned
+        #   instead (getStatus is then GENERATE_DEGRADED), or None if there is none (GENERATE_OUT_OF_BUDGET)
 
         if self.final_hidden_numbers_grid is not None:
             return self.final_hidden_numbers_grid
-
-        self.generate_hidden_numbers_attempts += 1
+        if self.solved_grid is None:
+            # the budget ran out while seeding
+            return None
 
         # bad input, difficulty must be [1-5]
         if not (1 <= difficulty <= 5):
             return None
+        if symmetry is not None and symmetry not in CLUE_SYMMETRIES:
+            return None
 
-        # grid to store final grid with hidden numbers removed
-        final_hidden_numbers_grid = self.solved_grid.getCopy()
-        if difficulty == 0:
-            # difficulty 0 means none hidden
-            self.final_hidden_numbers_grid = final_hidden_numbers_grid
-            return
+        self.hide_stats = {
+            'removals_accepted': 0,
+            'removals_rejected': 0,
+            'rollbacks': 0,
+            'restarts': 0,
+            'budget_stops': 0,
+            'removals_discarded': 0,
+            'checks_discarded': 0,
+            'removals_screened': 0,
+            'removals_forced': 0,
+            'searches': 0,
+            'status': SEARCH_DONE,
+        }
+        stage_start_time = time.perf_counter()
+        final_hidden_numbers_grid = None
+        for attempt_num in range(SudokuPuzzle.max_hide_attempts):
+            if self._isOutOfBudget():
+                break
+            self.generate_hidden_numbers_attempts += 1
+            final_hidden_numbers_grid = self._hideNumbers(difficulty, score_band, symmetry, is_minimal)
+            if final_hidden_numbers_grid is not None:
+                break
+            if self._isOutOfBudget():
+                # stopped by the budget, not a restart
+                self.hide_stats['budget_stops'] += 1
+                break
+            self.hide_stats['restarts'] += 1
+        self._addStageTime('hide', stage_start_time)
+
+        if final_hidden_numbers_grid is not None:
+            return self._finishHiddenNumbersGrid(final_hidden_numbers_grid)
+        self.hide_stats['status'] = SEARCH_PAUSED
+        if not self._isOutOfBudget():
+            self.status = GENERATE_GAVE_UP
+            return None
+        # out of budget, settle for the best discarded attempt
+        if self.best_hidden_numbers_grid is None:
+            self.status = GENERATE_OUT_OF_BUDGET
+            return None
+        self.status = GENERATE_DEGRADED
+        return self._finishHiddenNumbersGrid(self.best_hidden_numbers_grid)
+
+    def _finishHiddenNumbersGrid(self, final_hidden_numbers_grid):
+        stage_start_time = time.perf_counter()
+        solver = SOLVER_CLASSES[self.solver_name](self.collect_stats)
+        if not solver.checkHasSingleSolution(final_hidden_numbers_grid):
+            # only possible if the uniqueness checks are wrong
+            raise RuntimeError('Hidden numbers grid does not have a single solution')
+        self._addStageTime('verify', stage_start_time)
+        if self.collect_stats:
+            self.solver_stats['final_solve'] = solver.getStats().toDict()
+        if self.status == GENERATE_PENDING:
+            self.status = GENERATE_DONE
+        self.final_hidden_numbers_grid = final_hidden_numbers_grid
+        return self.final_hidden_numbers_grid
+
+    def _hideNumbers(self, difficulty, score_band, symmetry, is_minimal):
+        # one hiding attempt, None if it ran out of rollbacks or reached a dead end it cannot roll back from
+        # grid to store final grid with hidden numbers removed, owned by the uniqueness checker so each
+        #   removal can be verified against the known solved grid
+        # once the budget runs out the attempt stops and leaves its grid (valid after every accepted removal) as
+        #   a fallback
+        node_budget = None if self.node_budget is None else max(0, self.node_budget - self.num_nodes)
+        checker = SudokuUniquenessChecker(
+            self.solved_grid, self.collect_stats, result_cache=self.result_cache, node_budget=node_budget
+        )
+        final_hidden_numbers_grid = checker.puzzle_grid
+        hide_stats = self.hide_stats
+        num_checks = 0
+        num_removals = 0
+
+        shape = self.shape
 
         # grid to store remaining hideable numbers (discounting flagged as hidden/always shown)
         hideable_numbers_grid = self.solved_grid.getCopy()
 
-        # flag one of each 1-9 as always visible (may later be superseded)
-        for i in range(9):
-            search = i + 1
-            # get a random subgrid within which to always show the search number
-            subgrid_show_position = random.randint(0, 8)
-            (subgrid_x, subgrid_y) = SudokuPuzzle.population_pattern_order_all[subgrid_show_position]
-            # flag the x, y coords of the search number within this subgrid as never hide
-            (x, y) = self.solved_grid.findSubGridValueXY(subgrid_x, subgrid_y, search)
-            hideable_numbers_grid.setXYValue(x, y, None)
+        # the per value stages below hide single positions, symmetric clues are only ever hidden a whole orbit
+        #   at a time, and a minimal puzzle can not keep positions visible that it does not need
+        is_per_value = symmetry is None
+
+        if is_per_value and not is_minimal:
+            # flag one of each value as always visible (may later be superseded)
+            for i in range(shape.size):
+                search = i + 1
+                # get a random subgrid within which to always show the search number
+                subgrid_num = self.random.randint(0, shape.size - 1)
+                (subgrid_x, subgrid_y) = (subgrid_num % shape.box_size, subgrid_num // shape.box_size)
+                # flag the x, y coords of the search number within this subgrid as never hide
+                (x, y) = self.solved_grid.findSubGridValueXY(subgrid_x, subgrid_y, search)
+                hideable_numbers_grid.setXYValue(x, y, None)
+
+        # minimal puzzles keep hiding until no position can be hidden
+        max_visible_count = 0 if is_minimal else SudokuPuzzle.difficulty_visible_counts[shape.box_size][difficulty - 1]
 
-        # difficulty mappings for [1, 2, 3, 4, 5]
-        max_visible_count = [32, 30, 28, 27, 26][difficulty - 1]
+        visible_count = shape.num_cells
 
-        visible_count = 81
+        # a minimal puzzle ignores the score band, it only stops once nothing more can be hidden
+        # removals in every stage are graded, so a band below the score the per value stages would reach on their
+        #   own can still be hit
+        grader = SudokuGrader() if score_band is not None and not is_minimal else None
+        grade = None
 
         # hardest difficulty special behavior
-        if difficulty == 5:
+        if difficulty == 5 and is_per_value:
             # remove all instances of one number
-            num_to_remove = random.randint(1, 9)
+            num_to_remove = self.random.randint(1, shape.size)
             for (x, y) in final_hidden_numbers_grid.findValueAllXY(num_to_remove):
                 hideable_numbers_grid.setXYValue(x, y, None)
                 final_hidden_numbers_grid.setXYValue(x, y, None)
                 visible_count -= 1
+            if grader is not None:
+                grade = grader.grade(final_hidden_numbers_grid, self.solved_grid)
+                if grade[0] > score_band[1]:
+                    # already past the band, no removal after this can bring the score back down
+                    return self._stopHiding(checker, final_hidden_numbers_grid, num_checks, num_removals)
 
         # we will be checking every number we remove from now on to verify the
-        #   removal still results in a single-solution grid
-        solver = SudokuSolver()
+        #   removal still results in a single-solution grid, the full solver only double checks the final grid
 
-        num_of_each_number_to_hide = difficulty
-        # flag num_of_each_number_to_hide instances of each 1-9 as hidden
+        num_of_each_number_to_hide = difficulty if is_per_value else 0
+        # flag num_of_each_number_to_hide instances of each value as hidden
         for remove_iteration in range(num_of_each_number_to_hide):
-            for search in range(9):
+            for search in range(shape.size):
+                if checker.is_out_of_budget or self._isOutOfBudget(checker):
+                    return self._stopHiding(checker, final_hidden_numbers_grid, num_checks, num_removals)
                 search += 1
                 # find randomized hideable xy positions of the search number
                 hideable_xy = hideable_numbers_grid.findValueAllXY(search)
-                random.shuffle(hideable_xy)
+                self.random.shuffle(hideable_xy)
 
                 # attempt to remove each potential xy until the removal results in single solution
                 for (x, y) in hideable_xy:
                     final_hidden_numbers_grid.setXYValue(x, y, None)
-                    has_single_solution = solver.checkHasSingleSolution(final_hidden_numbers_grid)
+                    num_checks += 1
+                    has_single_solution = checker.checkHiddenXYKeepsSingleSolution(x, y)
+                    new_grade = grade
+                    if has_single_solution and grader is not None:
+                        new_grade = grader.grade(final_hidden_numbers_grid, self.solved_grid)
+                        has_single_solution = new_grade[0] <= score_band[1]
                     if has_single_solution:
+                        grade = new_grade
                         hideable_numbers_grid.setXYValue(x, y, None)
                         visible_count -= 1
+                        num_removals += 1
+                        hide_stats['removals_accepted'] += 1
                         break
                     else:
-                        # undo hiding, will retry at a different position
+                        hide_stats['removals_rejected'] += 1
+                        # undo hiding (a single solution that overshoots the band too), will retry at a different
+                        #   position
                         final_hidden_numbers_grid.setXYValue(x, y, search)
 
-        # get randomized list of every remaining hideable position
-        hideable_xy = hideable_numbers_grid.findNotValueAllXY(None)
-        random.shuffle(hideable_xy)
-
-        # flag to prevent neverending calculation if we somehow reach a dead end
-        attempts_since_last_match = 0
-
-        while visible_count > max_visible_count:
-            # get next xy to attempt to hide
-            (x, y) = hideable_xy.pop(0)
-            existing_value = final_hidden_numbers_grid.getXYValue(x, y)
+        # get randomized list of every remaining hideable orbit (the positions hidden together, a single
+        #   position without symmetry)
+        if symmetry is None:
+            pending_orbits = [((x, y),) for (x, y) in hideable_numbers_grid.findNotValueAllXY(None)]
+        else:
+            pending_orbits = getSymmetryOrbits(shape, symmetry)
+        self.random.shuffle(pending_orbits)
+        # try the orbits in the most unavoidable sets first (pending orbits are popped from the end, the sort keeps
+        #   the shuffled order between equal counts), hiding one pins the rest of its sets visible sooner, so
+        #   more of the later orbits fail in bulk instead of by search
+        pending_orbits.sort(key=lambda orbit: sum(checker.getUnavoidableSetCount(x, y) for (x, y) in orbit))
+
+        # hiding more numbers never makes a removal that failed valid again, so a failed orbit is only worth
+        #   retrying after rolling back past the removals made since it failed
+        # each checkpoint is (trail mark before the removal, removed orbit, grade before the removal, checks made
+        #   before the removal, orbits that failed with the removal in place)
+        checkpoints = []
+        base_failed_orbits = []
+        failed_orbits = base_failed_orbits
+
+        num_rollbacks = 0
+
+        while True:
+            if grader is None:
+                is_done = visible_count <= max_visible_count
+            else:
+                is_done = grade is not None and grade[0] >= score_band[0]
+            if is_done or (is_minimal and not pending_orbits):
+                # every orbit left failed with fewer positions visible than now, so none can be hidden
+                break
+            if checker.is_out_of_budget or self._isOutOfBudget(checker):
+                return self._stopHiding(checker, final_hidden_numbers_grid, num_checks, num_removals)
+
+            if not pending_orbits:
+                # dead end, roll back the latest removal and retry the orbits that failed since
+                if not checkpoints or num_rollbacks >= SudokuPuzzle.max_hide_rollbacks:
+                    # the whole attempt is thrown away
+                    return self._stopHiding(checker, final_hidden_numbers_grid, num_checks, num_removals)
+                (trail_mark, orbit, grade, checkpoint_num_checks, pending_orbits) = checkpoints.pop()
+                final_hidden_numbers_grid.undoToTrailMark(trail_mark)
+                visible_count += len(orbit)
+                num_removals -= len(orbit)
+                num_rollbacks += 1
+                hide_stats['rollbacks'] += 1
+                hide_stats['removals_discarded'] += len(orbit)
+                hide_stats['checks_discarded'] += num_checks - checkpoint_num_checks
+                num_checks = checkpoint_num_checks
+                # the rolled back removal stays failed for the state it was made in
+                failed_orbits = checkpoints[-1][4] if checkpoints else base_failed_orbits
+                failed_orbits.append(orbit)
+                continue
+
+            # get next orbit to attempt to hide
+            orbit = pending_orbits.pop()
+            trail_mark = final_hidden_numbers_grid.getTrailMark()
 
             # attempt to hide, will undo if unsuccessful
-            final_hidden_numbers_grid.setXYValue(x, y, None)
-            has_single_solution = solver.checkHasSingleSolution(final_hidden_numbers_grid)
+            for (x, y) in orbit:
+                final_hidden_numbers_grid.setXYValue(x, y, None)
+            num_checks += 1
+            has_single_solution = checker.checkHiddenXYsKeepSingleSolution(orbit)
+            new_grade = grade
+            if has_single_solution and grader is not None:
+                new_grade = grader.grade(final_hidden_numbers_grid, self.solved_grid)
+                # overshooting the band is treated the same as a removal that breaks the single solution
+                has_single_solution = new_grade[0] <= score_band[1]
             if has_single_solution:
-                # can safely hide this xy position
-                attempts_since_last_match = 0
-                visible_count -= 1
+                # can safely hide this orbit, checkpoint the state before it
+                checkpoints.append((trail_mark, orbit, grade, num_checks - 1, []))
+                failed_orbits = checkpoints[-1][4]
+                grade = new_grade
+                visible_count -= len(orbit)
+                num_removals += len(orbit)
+                hide_stats['removals_accepted'] += len(orbit)
+
+                # orbits holding a position that must now stay visible fail in bulk, without any checks
+                forced_xys = checker.getForcedVisibleXYs(orbit)
+                if forced_xys:
+                    kept_orbits = []
+                    for pending_orbit in pending_orbits:
+                        if not forced_xys.isdisjoint(pending_orbit):
+                            failed_orbits.append(pending_orbit)
+                            hide_stats['removals_screened'] += 1
+                        else:
+                            kept_orbits.append(pending_orbit)
+                    pending_orbits = kept_orbits
             else:
-                # undo hiding, will retry at a different position
-                final_hidden_numbers_grid.setXYValue(x, y, existing_value)
-                # add the xy back to end of queue
-                hideable_xy.append([x, y])
-                attempts_since_last_match += 1
-                if attempts_since_last_match > len(hideable_xy):
-                    # fail if we have tried every xy position and have not had a successful removal
-                    break
+                # undo hiding
+                final_hidden_numbers_grid.undoToTrailMark(trail_mark)
+                failed_orbits.append(orbit)
+                hide_stats['removals_rejected'] += 1
+
+        self._addCheckerStats(checker)
+        self.final_grade = grade
+        return final_hidden_numbers_grid
+
+    def _stopHiding(self, checker, final_hidden_numbers_grid, num_checks, num_removals):
+        # throws the attempt away, keeping its grid if it has the fewest clues of any discarded attempt so far
+        self.hide_stats['removals_discarded'] += num_removals
+        self.hide_stats['checks_discarded'] += num_checks
+        self._addCheckerStats(checker)
+        best_grid = self.best_hidden_numbers_grid
+        num_hidden = final_hidden_numbers_grid.cells.count(0)
+        if num_hidden and (best_grid is None or num_hidden > best_grid.cells.count(0)):
+            self.best_hidden_numbers_grid = final_hidden_numbers_grid.getCopy()
+        return None
 
-        if attempts_since_last_match > 0 or not solver.checkHasSingleSolution(final_hidden_numbers_grid):
-            # unlikely -- failed generation, try again
-            return self.getHiddenNumbersGrid(difficulty)
+    def _addCheckerStats(self, checker):
+        self.hide_stats['removals_screened'] += checker.num_screened
+        self.hide_stats['removals_forced'] += checker.num_forced
+        self.hide_stats['searches'] += checker.num_searched
+        self.num_nodes += checker.getNumNodes()
+        if self.collect_stats:
+            self.solver_stats['uniqueness_checks'] = checker.getStats().toDict()
+
+    def _isOutOfBudget(self, checker = None):
+        # checker is the uniqueness checker of the attempt in progress, its nodes are not counted in yet
+        if self.time_budget is not None and time.time() - self.start_time >= self.time_budget:
+            return True
+        if self.node_budget is not None:
+            num_nodes = self.num_nodes + (checker.getNumNodes() if checker is not None else 0)
+            return num_nodes >= self.node_budget
+        return False
 
-        self.final_hidden_numbers_grid = final_hidden_numbers_grid
-        return self.final_hidden_numbers_grid
+    def _addStageTime(self, stage, stage_start_time):
+        self.stage_times[stage] = self.stage_times.get(stage, 0.0) + time.perf_counter() - stage_start_time
 
     def _seedRandomSolvedGrid(self):
-        is_valid = False
-        self.solved_grid = SudokuGrid()
-
-        for (subgrid_x, subgrid_y) in SudokuPuzzle.population_pattern_order_no_conflicts:
-            # populate each subgrid in the overall grid
-            self._seedSubGridNoConflicts(subgrid_x, subgrid_y)
-
-        while (self.seed_random_attempts < 500 and not is_valid):
-            self.seed_random_attempts += 1
-            for (subgrid_x, subgrid_y) in SudokuPuzzle.population_pattern_order_with_conflicts:
-                # populate each subgrid in the overall grid
-                is_valid = self._seedSubGridWithConflicts(subgrid_x, subgrid_y)
-                if not is_valid:
-                    # failed out of this pass, try again from scratch
-                    break
-
-            if not is_valid:
-                for (subgrid_x, subgrid_y) in SudokuPuzzle.population_pattern_order_with_conflicts:
-                    # reset each subgrid in the overall grid
-                    self.solved_grid.resetSubGrid(subgrid_x, subgrid_y)
+        stage_start_time = time.perf_counter()
+        if self.grid_pool is not None:
+            self.solved_grid = self.grid_pool.getRandomSolvedGrid(self.random)
+            self._addStageTime('seed', stage_start_time)
+            return self
+
+        while True:
+            self.num_nodes = self.seed_random_attempts
+            if self._isOutOfBudget():
+                # fail fast, there is no solved grid to hide numbers from
+                self.solved_grid = None
+                self.status = GENERATE_OUT_OF_BUDGET
+                break
+            self.solved_grid = SudokuGrid(self.box_size)
+
+            # populate each subgrid on the diagonal (only the first one on a 4x4 grid, where some fillings of both
+            #   diagonal subgrids can not be completed)
+            for subgrid_xy in range(self.box_size if self.box_size > 2 else 1):
+                self._seedSubGridNoConflicts(subgrid_xy, subgrid_xy)
+
+            # the diagonal subgrids never conflict with each other and any filling of them can be completed, but
+            #   on bigger grids an unlucky early value can leave the backtracking search stuck for a very long
+            #   time, so it starts over from fresh diagonal subgrids once it has tried too many values
+            self.seed_attempt_budget = self.seed_random_attempts + self.shape.num_cells * self.max_seed_attempts
+            if self.node_budget is not None:
+                self.seed_attempt_budget = min(self.seed_attempt_budget, self.node_budget)
+            if self._seedRemainingXYWithBacktracking():
+                self.num_nodes = self.seed_random_attempts
+                break
+        self._addStageTime('seed', stage_start_time)
         return self
 
     def _seedSubGridNoConflicts(self, subgrid_x, subgrid_y):
@@ -440,67 +1792,86 @@ class SudokuPuzzle:
         self.solved_grid.setSubgridValues(subgrid_x, subgrid_y, eligible_values)
         return True
 
-    def _seedSubGridWithConflicts(self, subgrid_x, subgrid_y):
-        min_x = subgrid_x * 3
-        min_y = subgrid_y * 3
-
-        is_valid = False
-        attempts = 0
-        one_only_nums = [None for x in range(9)]
-
-        self.solved_grid.resetSubGrid(subgrid_x, subgrid_y)
-
-        for (i, (x, y)) in enumerate(SudokuPuzzle.population_pattern_order_all):
-            x += min_x
-            y += min_y
+    def _seedRemainingXYWithBacktracking(self):
+        grid = self.solved_grid
+
+        # pick the empty position with the fewest eligible values (scanned col by col, straight off the cell
+        #   tables since this runs once per value placed)
+        cells = grid.cells
+        shape = grid.shape
+        mask_bit_counts = shape.mask_bit_counts
+        fewest_possibilities = shape.size + 1
+        fewest_possibility_cell = None
+        for i in shape.column_order_cells:
+            if cells[i]:
+                continue
+            eligible_mask = grid.getCellCandidateMask(i)
+            num_eligible_values = mask_bit_counts[eligible_mask]
+            if num_eligible_values < fewest_possibilities:
+                fewest_possibilities = num_eligible_values
+                fewest_possibility_cell = i
+                fewest_possibility_mask = eligible_mask
+                if num_eligible_values <= 1:
+                    break
 
-            xy_conflicts = list(set(self.solved_grid.getRowUsedValues(y) + self.solved_grid.getColUsedValues(x) + [None]))
-            xy_conflicts.remove(None)
+        if fewest_possibility_cell is None:
+            # totally filled
+            return True
 
-            if len(xy_conflicts) == 8:
-                one_only_nums[i] = self._getRandomRangeWithExclusions(xy_conflicts)[0]
-            elif len(xy_conflicts) == 9:
-                # no way we can fill this spot, fail now
-                return False
+        (x, y) = (shape.cell_col[fewest_possibility_cell], shape.cell_row[fewest_possibility_cell])
+        eligible_values = list(grid.shape.mask_values[fewest_possibility_mask])
+        self.random.shuffle(eligible_values)
+        for eligible_value in eligible_values:
+            if self.seed_random_attempts >= self.seed_attempt_budget:
                 break
+            # count every value tried, values later backed out of included
+            self.seed_random_attempts += 1
+            grid.setXYValue(x, y, eligible_value)
+            if self._seedRemainingXYWithBacktracking():
+                return True
 
-        while (attempts < 50 and not is_valid):
-            self.solved_grid.resetSubGrid(subgrid_x, subgrid_y)
-
-            attempts += 1
-            is_valid = True
-            # copy
-            self_used = list(one_only_nums)
-            for (i, (x, y)) in enumerate(SudokuPuzzle.population_pattern_order_all):
-                x += min_x
-                y += min_y
-
-                if one_only_nums[i] is not None:
-                    new_value = one_only_nums[i]
-                else:
-                    xy_conflicts = self.solved_grid.getRowUsedValues(y) + self.solved_grid.getColUsedValues(x)
-                    eligible_values = self._getRandomRangeWithExclusions(xy_conflicts + self_used)
-
-                    if len(eligible_values) == 0:
-                        # dead end
-                        is_valid = False
-                        break
-                    new_value = eligible_values[0]
-
-                self.solved_grid.setXYValue(x, y, new_value)
-                self_used.append(new_value)
-
-        return is_valid
+        # dead end (or no eligible values), undo and let the previous position try its next value
+        grid.setXYValue(x, y, None)
+        return False
 
     def _getRandomRangeWithExclusions(self, exclude_numbers=[]):
         # casting as set also uniques the exclude_numbers list
-        numbers = list(set([1, 2, 3, 4, 5, 6, 7, 8, 9]) - set(exclude_numbers))
+        numbers = list(set(range(1, self.shape.size + 1)) - set(exclude_numbers))
         if len(numbers) > 1:
-            random.shuffle(numbers)
+            self.random.shuffle(numbers)
         return numbers
 
     def test(self):
-        return self.solved_grid.test()
+        return self.solved_grid is not None and self.solved_grid.test()
 
     def getElapsedTime(self):
         return time.time() - self.start_time
+
+
+def generatePuzzle(difficulty = 1, solver_name = 'backtrack', seed = None, grid_pool = None, score_band = None,
+                   collect_stats = False, box_size = 3, symmetry = None, is_minimal = False, time_budget = None,
+                   node_budget = None):
+    # SudokuPuzzle.getHiddenNumbersGrid, starting over with a new solved grid (continuing the same random stream)
+    #   each time the criteria are out of reach from the current one
+    # returns (puzzle, hidden numbers grid), the grid is None if the budget ran out first or every one of
+    #   SudokuPuzzle.max_solved_grid_attempts solved grids was given up on (see SudokuPuzzle.getStatus), the
+    #   budget covers every solved grid tried, time spent on the ones given up on is the 'retry' stage time of the
+    #   puzzle returned
+    start_time = time.time()
+    num_nodes = 0
+    puzzle = SudokuPuzzle(solver_name, seed, grid_pool, collect_stats, box_size, None, time_budget, node_budget)
+    for attempt_num in range(SudokuPuzzle.max_solved_grid_attempts):
+        hidden_numbers_grid = puzzle.getHiddenNumbersGrid(difficulty, score_band, symmetry, is_minimal)
+        if hidden_numbers_grid is not None or puzzle.getStatus() != GENERATE_GAVE_UP:
+            return (puzzle, hidden_numbers_grid)
+        if attempt_num == SudokuPuzzle.max_solved_grid_attempts - 1:
+            break
+        num_nodes += puzzle.num_nodes
+        retry_time = time.time() - start_time
+        puzzle = SudokuPuzzle(
+            solver_name, puzzle.random, grid_pool, collect_stats, box_size, None,
+            None if time_budget is None else time_budget - retry_time,
+            None if node_budget is None else max(0, node_budget - num_nodes),
+        )
+        puzzle.stage_times['retry'] = retry_time
+    return (puzzle, None)
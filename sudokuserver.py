@@ -0,0 +1,189 @@
+#!/usr/bin/python
+import sys
+import time
+import random
+import asyncio
+import collections
+import concurrent.futures
+import multiprocessing
+import sudokupuzzle
+
+
+# recent generate/serve events kept per difficulty for the rate and latency metrics
+metrics_window_size = 256
+# seconds a refill task waits after a failed refill before trying again
+refill_retry_delay = 1.0
+
+
+class SudokuServerBusyError(RuntimeError):
+    # raised by getPuzzle when too many requests are already waiting on an empty ready queue
+    pass
+
+
+def generateServedPuzzle(task):
+    # runs in a pool process, returns the puzzle as (hidden numbers string, solved string, generate seconds)
+    # raises RuntimeError if every solved grid tried was given up on, the refill counts it as a failed refill
+    (difficulty, solver_name, seed) = task
+    start_time = time.time()
+    (puzzle, hidden_numbers_grid) = sudokupuzzle.generatePuzzle(difficulty, solver_name, seed)
+    if hidden_numbers_grid is None:
+        raise RuntimeError('Gave up on a difficulty %d puzzle (%s)' % (difficulty, puzzle.getStatus()))
+    return (
+        hidden_numbers_grid.getDisplayString(False),
+        puzzle.getSolvedGrid().getDisplayString(False),
+        time.time() - start_time,
+    )
+
+
+class SudokuPuzzleServer:
+    # asyncio front end to the generator: a process pool keeps a ready queue of puzzles per difficulty topped up
+    #   to the watermark in the background, so serving a puzzle is normally just a queue get
+    # refills stop while a queue is full, and requests past max_waiting on an empty queue are turned away
+    def __init__(self, difficulties = (1, 2, 3, 4, 5), watermark = 8, num_workers = None,
+                 solver_name = 'backtrack', seed = None, max_waiting = 64):
+        self.difficulties = tuple(difficulties)
+        self.watermark = watermark
+        self.num_workers = num_workers or multiprocessing.cpu_count()
+        self.solver_name = solver_name
+        # per puzzle seeds are drawn in order from this stream (unseeded puzzles each get a fresh random stream)
+        self.seed_random = random.Random(seed) if seed is not None else None
+        self.max_waiting = max_waiting
+        self.pool = None
+        self.ready_queues = {}
+        self.refill_tasks = []
+        # puts of puzzles taken by cancelled requests that are waiting for room in a full queue
+        self.put_back_tasks = set()
+        self.num_waiting = dict((difficulty, 0) for difficulty in self.difficulties)
+        self.num_generated = dict((difficulty, 0) for difficulty in self.difficulties)
+        self.num_served = dict((difficulty, 0) for difficulty in self.difficulties)
+        self.num_rejected = dict((difficulty, 0) for difficulty in self.difficulties)
+        self.num_refill_errors = dict((difficulty, 0) for difficulty in self.difficulties)
+        # (finish time, generate seconds) of recent refills, serve seconds of recent requests
+        self.generate_events = dict(
+            (difficulty, collections.deque(maxlen=metrics_window_size)) for difficulty in self.difficulties
+        )
+        self.serve_times = dict(
+            (difficulty, collections.deque(maxlen=metrics_window_size)) for difficulty in self.difficulties
+        )
+
+    async def start(self):
+        self.pool = concurrent.futures.ProcessPoolExecutor(self.num_workers)
+        # spread the pool across the difficulties, at least one refill in flight for each
+        refills_per_difficulty = max(1, self.num_workers // len(self.difficulties))
+        for difficulty in self.difficulties:
+            self.ready_queues[difficulty] = asyncio.Queue(self.watermark)
+            for i in range(refills_per_difficulty):
+                self.refill_tasks.append(asyncio.ensure_future(self._refillQueue(difficulty)))
+        return self
+
+    async def stop(self):
+        for refill_task in self.refill_tasks:
+            refill_task.cancel()
+        await asyncio.gather(*self.refill_tasks, return_exceptions=True)
+        self.refill_tasks = []
+        for put_task in list(self.put_back_tasks):
+            put_task.cancel()
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.stop()
+
+    async def getPuzzle(self, difficulty, timeout = None):
+        # returns (hidden numbers grid, solved grid), waiting for a refill if the ready queue is empty
+        # raises SudokuServerBusyError when max_waiting requests are already waiting, asyncio.TimeoutError after
+        #   timeout seconds, a cancelled or timed out request does not consume a puzzle
+        queue = self.ready_queues[difficulty]
+        start_time = time.perf_counter()
+        if queue.empty() and self.num_waiting[difficulty] >= self.max_waiting:
+            self.num_rejected[difficulty] += 1
+            raise SudokuServerBusyError('Too many requests waiting for difficulty %d puzzles' % difficulty)
+
+        # the get runs as its own task so a puzzle it already took off the queue can be put back, wait_for could
+        #   drop one when a cancellation races the get finishing
+        self.num_waiting[difficulty] += 1
+        get_task = asyncio.ensure_future(queue.get())
+        try:
+            await asyncio.wait((get_task,), timeout=timeout)
+        except asyncio.CancelledError:
+            self._cancelGet(queue, get_task)
+            raise
+        finally:
+            self.num_waiting[difficulty] -= 1
+        if not get_task.done():
+            self._cancelGet(queue, get_task)
+            raise asyncio.TimeoutError()
+        (hidden_numbers_string, solved_string) = get_task.result()
+
+        hidden_numbers_grid = sudokupuzzle.SudokuGrid()
+        hidden_numbers_grid.seedFromString(hidden_numbers_string)
+        solved_grid = sudokupuzzle.SudokuGrid()
+        solved_grid.seedFromString(solved_string)
+        self.num_served[difficulty] += 1
+        self.serve_times[difficulty].append(time.perf_counter() - start_time)
+        return (hidden_numbers_grid, solved_grid)
+
+    def getMetrics(self):
+        # per difficulty queue depth, waiting requests, counters, refill rate (puzzles/sec between the first and
+        #   last of the recent refills, 0 until there are two) and recent serve latencies
+        metrics = {}
+        for difficulty in self.difficulties:
+            generate_events = self.generate_events[difficulty]
+            serve_times = sorted(self.serve_times[difficulty])
+            refill_rate = 0.0
+            if len(generate_events) > 1:
+                window_time = generate_events[-1][0] - generate_events[0][0]
+                refill_rate = (len(generate_events) - 1) / window_time if window_time > 0 else 0.0
+            metrics[difficulty] = {
+                'queue_depth': self.ready_queues[difficulty].qsize() if difficulty in self.ready_queues else 0,
+                'waiting': self.num_waiting[difficulty],
+                'generated': self.num_generated[difficulty],
+                'served': self.num_served[difficulty],
+                'rejected': self.num_rejected[difficulty],
+                'refill_errors': self.num_refill_errors[difficulty],
+                'refill_rate': round(refill_rate, 3),
+                'generate_mean_ms': round(
+                    sum(event[1] for event in generate_events) / len(generate_events) * 1000, 3
+                ) if generate_events else None,
+                'serve_p50_ms': round(serve_times[len(serve_times) // 2] * 1000, 3) if serve_times else None,
+                'serve_max_ms': round(serve_times[-1] * 1000, 3) if serve_times else None,
+            }
+        return metrics
+
+    def _cancelGet(self, queue, get_task):
+        # a get that has not finished leaves the queue untouched once cancelled, one that has gets its puzzle put
+        #   back
+        if get_task.cancel() or get_task.cancelled() or get_task.exception() is not None:
+            return
+        try:
+            queue.put_nowait(get_task.result())
+        except asyncio.QueueFull:
+            # a refill filled the slot the get freed, wait for room like a refill would
+            put_task = asyncio.ensure_future(queue.put(get_task.result()))
+            self.put_back_tasks.add(put_task)
+            put_task.add_done_callback(self.put_back_tasks.discard)
+
+    async def _refillQueue(self, difficulty):
+        loop = asyncio.get_running_loop()
+        queue = self.ready_queues[difficulty]
+        while True:
+            seed = self.seed_random.getrandbits(64) if self.seed_random is not None else None
+            try:
+                (hidden_numbers_string, solved_string, generate_time) = await loop.run_in_executor(
+                    self.pool, generateServedPuzzle, (difficulty, self.solver_name, seed)
+                )
+            except Exception as error:
+                # a failed refill must not end the task, or the queue would never refill and requests would
+                #   wait forever
+                self.num_refill_errors[difficulty] += 1
+                sys.stderr.write('Refill failed for difficulty %d: %r\n' % (difficulty, error))
+                await asyncio.sleep(refill_retry_delay)
+                continue
+            self.num_generated[difficulty] += 1
+            self.generate_events[difficulty].append((time.time(), generate_time))
+            # waits while the queue is at the watermark, so a full queue stops refilling
+            await queue.put((hidden_numbers_string, solved_string))
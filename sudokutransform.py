@@ -0,0 +1,110 @@
+#!/usr/bin/python
+import itertools
+import random
+import sudokupuzzle
+
+
+# orderings of the 3 bands (row groups) / stacks (col groups), or of the 3 rows/cols within one of them
+GROUP_PERMUTATIONS = list(itertools.permutations(range(3)))
+# every ordering of the 9 cols that keeps valid grids valid (stack order + col order within each stack)
+LINE_PERMUTATIONS = [
+    [stack_order[s] * 3 + within_orders[s][j] for s in range(3) for j in range(3)]
+    for stack_order in GROUP_PERMUTATIONS
+    for within_orders in itertools.product(GROUP_PERMUTATIONS, repeat=3)
+]
+
+
+class SudokuGridTransform:
+    # validity preserving transform of a grid: optional transpose, then reorder rows and cols, then relabel
+    # values, the new value at x, y is digit_map[source value at col_order[x], row_order[y]]
+    def __init__(self, row_order = None, col_order = None, digit_map = None, is_transposed = False):
+        self.row_order = list(row_order) if row_order is not None else list(range(9))
+        self.col_order = list(col_order) if col_order is not None else list(range(9))
+        # digit_map[0] must stay 0 so empty positions stay empty
+        self.digit_map = list(digit_map) if digit_map is not None else list(range(10))
+        self.is_transposed = is_transposed
+
+    @staticmethod
+    def getRandom(rng = None):
+        rng = rng or random
+        digits = list(range(1, 10))
+        rng.shuffle(digits)
+        return SudokuGridTransform(
+            rng.choice(LINE_PERMUTATIONS),
+            rng.choice(LINE_PERMUTATIONS),
+            [0] + digits,
+            rng.random() < 0.5,
+        )
+
+    def applyToGrid(self, grid):
+        cells = grid.cells
+        digit_map = self.digit_map
+        if self.is_transposed:
+            # source position of row y, col x is swapped
+            source_indexes = [col * 9 + row for row in self.row_order for col in self.col_order]
+        else:
+            source_indexes = [row * 9 + col for row in self.row_order for col in self.col_order]
+        transformed_grid = sudokupuzzle.SudokuGrid()
+        transformed_grid.seedFromValues([digit_map[cells[i]] for i in source_indexes])
+        return transformed_grid
+
+
+def getCanonicalTransform(grid):
+    # finds the transform giving the lexicographically smallest grid string of every equivalent grid
+    # only defined for totally filled grids: the smallest grid always starts with row 123456789, so for each
+    #   choice of transpose, first row, and col order the relabeling is forced and the remaining rows only
+    #   need sorting, leaving 2 x 9 x 1296 candidates to compare instead of every transform
+    if not grid.test():
+        raise ValueError('Canonical form is only defined for totally filled valid grids')
+
+    best_key = None
+    best_transform = None
+    for is_transposed in (False, True):
+        if is_transposed:
+            rows = [grid.cells[col::9] for col in range(9)]
+        else:
+            rows = [grid.cells[row * 9:row * 9 + 9] for row in range(9)]
+        for first_row in range(9):
+            first_band = first_row // 3
+            band_mates = [row for row in range(first_band * 3, first_band * 3 + 3) if row != first_row]
+            other_bands = [band for band in range(3) if band != first_band]
+            for col_order in LINE_PERMUTATIONS:
+                # relabel so the first row reads 123456789
+                digit_map = [0] * 10
+                for (j, col) in enumerate(col_order):
+                    digit_map[rows[first_row][col]] = j + 1
+                mapped_rows = dict(
+                    (row, tuple(digit_map[rows[row][col]] for col in col_order)) for row in range(9)
+                )
+
+                row_order = [first_row] + sorted(band_mates, key=mapped_rows.get)
+                bands = sorted(
+                    (sorted(range(band * 3, band * 3 + 3), key=mapped_rows.get) for band in other_bands),
+                    key=lambda band_rows: mapped_rows[band_rows[0]],
+                )
+                row_order += bands[0] + bands[1]
+
+                key = tuple(mapped_rows[row] for row in row_order)
+                if best_key is None or key < best_key:
+                    best_key = key
+                    best_transform = SudokuGridTransform(row_order, col_order, digit_map, is_transposed)
+    return best_transform
+
+
+def getCanonicalGrid(grid):
+    # equivalent grids (under relabeling, band/stack/row/col permutation, transposition) share one canonical grid
+    return getCanonicalTransform(grid).applyToGrid(grid)
+
+
+class SudokuGridPool:
+    # small set of base solved grids, each request returns a randomly transformed copy of one of them
+    def __init__(self, num_base_grids = 8, seed = None):
+        self.random = seed if isinstance(seed, random.Random) else random.Random(seed)
+        self.base_grids = [
+            sudokupuzzle.SudokuPuzzle(seed=self.random).getSolvedGrid() for i in range(num_base_grids)
+        ]
+
+    def getRandomSolvedGrid(self, rng = None):
+        rng = rng or self.random
+        base_grid = rng.choice(self.base_grids)
+        return SudokuGridTransform.getRandom(rng).applyToGrid(base_grid)